@@ -4,7 +4,7 @@ __author__ = "Sven Sager"
 __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 
-from setuptools import find_namespace_packages, setup
+from setuptools import setup
 
 from src.revpipyload import __version__
 
@@ -12,7 +12,7 @@ setup(
     name="revpipyload",
     version=__version__,
 
-    packages=find_namespace_packages("src"),
+    packages=["revpipyload", "revpipyload.shared"],
     package_dir={'': 'src'},
     include_package_data=True,
 
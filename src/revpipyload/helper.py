@@ -6,12 +6,23 @@ __license__ = "GPLv2"
 
 import os
 from fcntl import ioctl
-from json import loads
-from re import match as rematch
-from subprocess import PIPE, Popen
+from stat import S_ISDIR
+from subprocess import PIPE, Popen, TimeoutExpired
 
 from . import proginit
 
+try:
+    # Optional: orjson parses bytes directly and much faster
+    from orjson import loads as jloads
+except ImportError:
+    from json import loads as jloads
+
+# Nullen für das gesamte Prozessabbild von piControl
+_ZEROS = bytes(4096)
+
+# KB_RESET _IO('K', 12 )  // reset the piControl driver including the config file
+KB_RESET = (ord("K") << 8) | 12
+
 
 def _setuprt(pid, evt_exit):
     """Konfiguriert Programm fuer den RT-Scheduler.
@@ -19,70 +30,79 @@ def _setuprt(pid, evt_exit):
     @return None"""
     proginit.logger.debug("enter _setuprt()")
 
+    # RT Priorität je Name der Kernelthreads auf CPU 0-3
     dict_change = {
-        "ksoftirqd/0,ksoftirqd/1,ksoftirqd/2,ksoftirqd/3": 10,
-        "ktimersoftd/0,ktimersoftd/1,ktimersoftd/2,ktimersoftd/3": 20
+        "ksoftirqd": 10,
+        "ktimersoftd": 20,
     }
-
-    for ps_change in dict_change:
-        # pid und prio ermitteln
-        kpidps = Popen([
-            "/bin/ps", "-o", "pid=,rtprio=", "-C", ps_change
-        ], bufsize=1, stdout=PIPE)
-
-        # Timeout nachbilden da in Python 3.2 nicht vorhanden
-        count = 10
-        while kpidps.poll() is None:
-            count -= 1
-            if count == 0:
-                kpidps.kill()
-                proginit.logger.error("ps timeout to get rt prio info - no rt active")
-                return None
-
-            evt_exit.wait(0.5)
-            if evt_exit.is_set():
-                return None
-
+    ps_change = ",".join(
+        "{0}/{1}".format(name, cpu) for name in dict_change for cpu in range(4)
+    )
+
+    # pid, prio und Name aller Threads mit einem Aufruf ermitteln
+    kpidps = Popen([
+        "/bin/ps", "-o", "pid=,rtprio=,comm=", "-C", ps_change
+    ], stdout=PIPE)
+
+    # Maximal 5 Sekunden warten, bei Programmende abbrechen
+    kpiddat = None
+    for _ in range(10):
         try:
-            kpiddat = kpidps.communicate()[0]
-            lst_kpids = kpiddat.split()
+            kpiddat = kpidps.communicate(timeout=0.5)[0]
+            break
+        except TimeoutExpired:
+            if evt_exit.is_set():
+                break
         except Exception:
             kpidps.kill()
+            kpidps.communicate()
             proginit.logger.error("can not get pid and prio - no rt active")
             return None
 
-        while len(lst_kpids) > 0:
-            # Elemente paarweise übernehmen
-            kpid = lst_kpids.pop(0)
-            kprio = lst_kpids.pop(0)
+    if kpiddat is None:
+        kpidps.kill()
+        kpidps.communicate()
+        if not evt_exit.is_set():
+            proginit.logger.error("ps timeout to get rt prio info - no rt active")
+        return None
+
+    for line in kpiddat.decode(errors="replace").splitlines():
+        # Elemente einer Zeile übernehmen
+        try:
+            kpid, kprio, kname = line.split()
+        except ValueError:
+            proginit.logger.error("ps line '{0}' is not valid - no rt active".format(line))
+            return None
+
+        # Daten prüfen
+        if not kpid.isdigit():
+            proginit.logger.error("pid={0} and prio={1} are not valid - no rt active".format(kpid, kprio))
+            return None
+        kpid = int(kpid)
+
+        # RTPrio ermitteln
+        if kprio.isdigit():
+            kprio = int(kprio)
+        else:
+            kprio = 0
 
-            # Daten prüfen
-            if not kpid.isdigit():
-                proginit.logger.error("pid={0} and prio={1} are not valid - no rt active".format(kpid, kprio))
+        if kprio < 10:
+            # Profile anpassen (wie chrt -fp)
+            try:
+                os.sched_setscheduler(
+                    kpid, os.SCHED_FIFO,
+                    os.sched_param(dict_change[kname.partition("/")[0]])
+                )
+            except (KeyError, OSError):
+                proginit.logger.error("could not adjust scheduler - no rt active")
                 return None
-            kpid = int(kpid)
-
-            # RTPrio ermitteln
-            if kprio.isdigit():
-                kprio = int(kprio)
-            else:
-                kprio = 0
-
-            if kprio < 10:
-                # Profile anpassen
-                ec = os.system("/usr/bin/env chrt -fp {0} {1}".format(
-                    dict_change[ps_change],
-                    kpid
-                ))
-                if ec != 0:
-                    proginit.logger.error("could not adjust scheduler - no rt active")
-                    return None
 
     # SCHED_RR für pid setzen
     proginit.logger.info("set scheduler profile of pid {0}".format(pid))
 
-    ec = os.system("/usr/bin/env chrt -p 1 {0}".format(pid))
-    if ec != 0:
+    try:
+        os.sched_setscheduler(pid, os.SCHED_RR, os.sched_param(1))
+    except OSError:
         proginit.logger.error("could not set scheduler profile of pid {0}".format(pid))
 
     proginit.logger.debug("leave _setuprt()")
@@ -92,11 +112,57 @@ def _zeroprocimg():
     """Setzt Prozessabbild auf NULL."""
     procimg = "/dev/piControl0" if proginit.pargs is None else proginit.pargs.procimg
 
-    if os.access(procimg, os.W_OK):
-        with open(procimg, "w+b", 0) as f:
-            f.write(bytes(4096))
-    else:
+    try:
+        # O_TRUNC wie vorher open("w+b"), bei piControl ohne Wirkung
+        fd = os.open(procimg, os.O_WRONLY | os.O_TRUNC)
+    except OSError:
         proginit.logger.error("zeroprocimg can not write to piControl device")
+        return
+
+    try:
+        os.write(fd, _ZEROS)
+    except OSError:
+        proginit.logger.error("zeroprocimg can not write to piControl device")
+    finally:
+        os.close(fd)
+
+
+def clear_directory(path, dir_fd=None):
+    """
+    Remove all files and directories inside of path, but not path itself.
+
+    Errors are ignored like shutil.rmtree(ignore_errors=True) does. All
+    entries are removed relative to an open directory descriptor, so the
+    current working directory does not matter and symlinks are never
+    followed into other directories.
+
+    :param path: Directory to clear
+    :param dir_fd: Descriptor of the parent directory, if path is relative
+    """
+    flags = os.O_RDONLY | os.O_DIRECTORY
+    if dir_fd is not None:
+        flags |= os.O_NOFOLLOW
+    try:
+        fd = os.open(path, flags, dir_fd=dir_fd)
+    except OSError:
+        return
+
+    try:
+        # os.scandir() accepts a descriptor since Python 3.7 only
+        for name in os.listdir(fd):
+            try:
+                st = os.stat(name, dir_fd=fd, follow_symlinks=False)
+                if S_ISDIR(st.st_mode):
+                    clear_directory(name, fd)
+                    os.rmdir(name, dir_fd=fd)
+                else:
+                    os.unlink(name, dir_fd=fd)
+            except OSError:
+                pass
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 def get_revpiled_address(configrsc_bytes):
@@ -106,7 +172,7 @@ def get_revpiled_address(configrsc_bytes):
     :return: Address or -1 on error
     """
     try:
-        rsc = loads(configrsc_bytes.decode())  # type: dict
+        rsc = jloads(configrsc_bytes)  # type: dict
     except Exception:
         return -1
 
@@ -130,16 +196,21 @@ def get_revpiled_address(configrsc_bytes):
     return byte_address
 
 
-def refullmatch(regex, string):
-    """re.fullmatch wegen alter python version aus wheezy nachgebaut.
+def iter_files(path):
+    """
+    Iterate all files below path, but do not follow symlinked directories.
 
-    @param regex RegEx Statement
-    @param string Zeichenfolge gegen die getestet wird
-    @return True, wenn komplett passt sonst False
+    Directories with __pycache__ in the name are skipped with all content.
 
+    :param path: Directory to search in
+    :return: Generator of file paths joined to path
     """
-    m = rematch(regex, string)
-    return m is not None and m.end() == len(string)
+    with os.scandir(path) as it:
+        for entry in it:
+            if not entry.is_dir():
+                yield entry.path
+            elif not (entry.is_symlink() or "__pycache__" in entry.name):
+                yield from iter_files(entry.path)
 
 
 def pi_control_reset():
@@ -158,8 +229,7 @@ def pi_control_reset():
         return 1
 
     try:
-        # KB_RESET _IO('K', 12 )  // reset the piControl driver including the config file
-        ioctl(fd, 19212)
+        ioctl(fd, KB_RESET)
         proginit.logger.info("reset piControl driver")
         return 0
     except Exception as e:
@@ -4,6 +4,7 @@ __author__ = "Sven Sager"
 __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 
+from logging import DEBUG
 from os.path import join
 from ssl import CERT_NONE
 from threading import Event, Thread
@@ -217,7 +218,8 @@ class MqttServer(Thread):
 
     def _on_message(self, client, userdata, msg):
         """Sendet piCtory Konfiguration."""
-        proginit.logger.debug("Received topic: {0}".format(msg.topic))
+        if proginit.logger.isEnabledFor(DEBUG):
+            proginit.logger.debug("Received topic: {0}".format(msg.topic))
 
         if msg.topic == self._mqtt_pictory:
             # piCtory Konfiguration senden
@@ -6,6 +6,7 @@ __license__ = "GPLv2"
 
 import socket
 from fcntl import ioctl
+from logging import DEBUG
 from struct import pack, unpack
 from threading import Event, Thread
 from timeit import default_timer
@@ -537,10 +538,11 @@ class RevPiPlcServerDev(Thread):
                     if proginit.pargs.procimg == "/dev/piControl0":
                         # Läuft auf RevPi
                         ioctl(fh_proc, request, bytes(buff_recv))
-                        proginit.logger.debug(
-                            "ioctl {0} with {1} successful"
-                            "".format(request, bytes(buff_recv))
-                        )
+                        if proginit.logger.isEnabledFor(DEBUG):
+                            proginit.logger.debug(
+                                "ioctl {0} with {1} successful"
+                                "".format(request, bytes(buff_recv))
+                            )
                     else:
                         # Simulation
                         # TODO: IOCTL für Dateien implementieren
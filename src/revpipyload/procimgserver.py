@@ -10,6 +10,7 @@ __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 
 import pickle
+from logging import DEBUG
 from xmlrpc.client import Binary
 
 import revpimodio2
@@ -36,6 +37,8 @@ class ProcimgServer:
 
         self.rpi = None
         self.replace_ios = replace_ios
+        self._devices_cache = []
+        self._ios_cache = {}
 
         # XML-Server übernehmen
         self.xmlsrv = xmlserver
@@ -69,7 +72,8 @@ class ProcimgServer:
         :param args: Optional arguments to pass to async function
         :return: Return value of async call
         """
-        proginit.logger.debug("ProcimgServer.async_call({0}, {1})".format(call, args))
+        if proginit.logger.isEnabledFor(DEBUG):
+            proginit.logger.debug("ProcimgServer.async_call({0}, {1})".format(call, args))
 
         if call == "ro_get_switching_cycles":
             # args = [io_name]
@@ -88,20 +92,18 @@ class ProcimgServer:
 
         raise ValueError("Unknown async function name in call argument")
 
-    def devices(self):
-        """Generiert Deviceliste mit Position und Namen.
-        @return list() mit Tuple (pos, name)"""
-        return [
-            (dev.position, dev.name) for dev in self.rpi.device
-        ]
-
-    def ios(self, iotype):
+    def _build_ios(self, iotype):
         """Generiert ein dict() der Devices und IOs.
         @param iotype IO Typ inp/out
-        @return pickled dict()"""
+        @return dict() mit Device Position und Liste der IOs"""
+        # Klassen für die Schleife einmal auflösen
+        IntIOCounter = revpimodio2.io.IntIOCounter
+        RelaisOutput = revpimodio2.io.RelaisOutput
+
         dict_ios = {}
         for dev in self.rpi.device:
-            dict_ios[dev.position] = []
+            lst_entries = dict_ios[dev.position] = []
+            dev_offset = dev.offset
 
             # IO Typen auswerten
             if iotype == "inp":
@@ -114,18 +116,18 @@ class ProcimgServer:
             for io in lst_io:
                 lst_async_calls = []
 
-                if isinstance(io, revpimodio2.io.IntIOCounter):
+                if isinstance(io, IntIOCounter):
                     # Counter IOs has a reset property
                     lst_async_calls.append("di_reset")
 
-                if isinstance(io, revpimodio2.io.RelaisOutput):
+                if isinstance(io, RelaisOutput):
                     # Relaisoutputs can read switching cycles
                     lst_async_calls.append("ro_get_switching_cycles")
 
-                dict_ios[dev.position].append([
+                lst_entries.append([
                     io.name,
-                    1 if io._bitlength == 1 else int(io._bitlength / 8),
-                    io._slc_address.start + dev.offset,
+                    io._bitlength >> 3 or 1,
+                    io._slc_address.start + dev_offset,
                     io.bmk,
                     io._bitaddress,
                     io._byteorder,
@@ -133,7 +135,21 @@ class ProcimgServer:
                     getattr(io, "wordorder", "ignored"),
                     lst_async_calls,
                 ])
-        return Binary(pickle.dumps(dict_ios))
+        return dict_ios
+
+    def devices(self):
+        """Liefert Deviceliste mit Position und Namen.
+        @return list() mit Tuple (pos, name)"""
+        return self._devices_cache
+
+    def ios(self, iotype):
+        """Liefert ein dict() der Devices und IOs.
+        @param iotype IO Typ inp/out
+        @return pickled dict()"""
+        pickled_ios = self._ios_cache.get(iotype)
+        if pickled_ios is None:
+            pickled_ios = Binary(pickle.dumps(self._build_ios(iotype)))
+        return pickled_ios
 
     def loadrevpimodio(self):
         """Instantiiert das RevPiModIO Modul.
@@ -141,6 +157,8 @@ class ProcimgServer:
         # RevPiModIO-Modul Instantiieren
         if self.rpi is not None:
             self.rpi.cleanup()
+        self._devices_cache = []
+        self._ios_cache = {}
 
         proginit.logger.debug("create revpimodio2 object for ProcimgServer")
         try:
@@ -175,6 +193,15 @@ class ProcimgServer:
                 )
                 return e
 
+        # Devices und IOs ändern sich nur mit neuem RevPiModIO
+        self._devices_cache = [
+            (dev.position, dev.name) for dev in self.rpi.device
+        ]
+        self._ios_cache = {
+            iotype: Binary(pickle.dumps(self._build_ios(iotype)))
+            for iotype in ("inp", "out")
+        }
+
         proginit.logger.debug("created revpimodio2 object")
 
     def setvalue(self, device, io, value):
@@ -213,10 +240,8 @@ class ProcimgServer:
         """Liefert Prozessabbild an Client.
         @return Binary() bytes or None"""
         if self.rpi.readprocimg():
-            bytebuff = bytearray()
-            for dev in self.rpi.device:
-                bytebuff += bytes(dev)
-            return Binary(bytes(bytebuff))
+            # Einmal zusammenfügen ohne wachsenden Puffer und Kopie am Ende
+            return Binary(b"".join(map(bytes, self.rpi.device)))
         else:
             return None
 
@@ -248,10 +273,8 @@ class ProcimgServer:
 
         # Entferne Funktionen
         for xmlfunc in self.xmlreadfuncs:
-            if xmlfunc in self.xmlsrv.funcs:
-                del self.xmlsrv.funcs[xmlfunc]
+            self.xmlsrv.unregister_function(xmlfunc)
         for xmlfunc in self.xmlwritefuncs:
-            if xmlfunc in self.xmlsrv.funcs:
-                del self.xmlsrv.funcs[xmlfunc]
+            self.xmlsrv.unregister_function(xmlfunc)
 
         proginit.logger.debug("leave ProcimgServer.stop()")
@@ -20,6 +20,8 @@ logplc = "revpipyload.log"
 logger = logging.getLogger()
 pargs = None
 rapcatalog = None
+rapcatalog_blob = ""
+rapcatalog_ids = frozenset()
 startdir = None
 
 
@@ -131,6 +133,16 @@ def configure():
         if os.path.isdir(rapfolder):
             rapcatalog = os.listdir(rapfolder)
 
+    # Dateinamen ohne Endung für schnelle Suche nach piCtory Device IDs
+    global rapcatalog_ids
+    rapcatalog_ids = frozenset(
+        os.path.splitext(rapfile)[0] for rapfile in rapcatalog or ()
+    )
+
+    # Alle Dateinamen für Teilstringsuche, \0 kann in keinem Namen vorkommen
+    global rapcatalog_blob
+    rapcatalog_blob = "\0".join(rapcatalog or ())
+
     # Pfade absolut umschreiben
     global startdir
     if startdir is None:
@@ -35,12 +35,13 @@ import tarfile
 import zipfile
 from configparser import ConfigParser
 from hashlib import md5
-from json import loads as jloads
+from io import BytesIO
 from re import search
-from shutil import rmtree
+from select import select
+from shutil import copyfileobj
 from tempfile import mkstemp
-from threading import Event
-from time import asctime, time
+from threading import Event, Lock, RLock
+from time import asctime, monotonic
 from xmlrpc.client import Binary
 
 from . import __version__
@@ -48,13 +49,177 @@ from . import logsystem
 from . import picontrolserver
 from . import plcsystem
 from . import proginit
-from .helper import get_revpiled_address, pi_control_reset, refullmatch
+from .helper import clear_directory, get_revpiled_address, iter_files, \
+    jloads, pi_control_reset
 from .shared.ipaclmanager import IpAclManager
-from .watchdogs import ResetDriverWatchdog
+from .watchdogs import FileChangeWatcher, ResetDriverWatchdog
 from .xrpcserver import SaveXMLRPCServer
 
 min_revpimodio = "2.5.0"
 
+# Blockgröße und maximale Anzahl offener Archive für plcdownload_chunked
+_DOWNLOAD_CHUNKSIZE = 1 << 19
+_DOWNLOAD_MAXOPEN = 4
+
+# Werte fuer xml_getconfig (XML-RPC Name, Attribut, als int() uebertragen)
+_CONFIG_FIELDS = (
+    # DEFAULT Sektion
+    ("autoreload", "autoreload", True),
+    ("autoreloaddelay", "autoreloaddelay", False),
+    ("autostart", "autostart", True),
+    ("plcworkdir", "plcworkdir", False),
+    ("plcworkdir_set_uid", "plcworkdir_set_uid", True),
+    ("plcprogram", "plcprogram", False),
+    ("plcprogram_stop_timeout", "plcprogram_stop_timeout", False),
+    ("plcprogram_watchdog", "plcprogram_watchdog", False),
+    ("plcarguments", "plcarguments", False),
+    ("plcuid", "plcuid", False),
+    ("plcgid", "plcgid", False),
+    ("pythonversion", "pythonversion", False),
+    ("reset_driver_action", "reset_driver_action", False),
+    ("rtlevel", "rtlevel", False),
+    ("zeroonerror", "zeroonerror", True),
+    ("zeroonexit", "zeroonexit", True),
+    # MQTT Sektion
+    ("mqtt", "mqtt", True),
+    ("mqttbasetopic", "mqttbasetopic", False),
+    ("mqttsendinterval", "mqttsendinterval", False),
+    ("mqttbroker_address", "mqttbroker_address", False),
+    ("mqttport", "mqttport", False),
+    ("mqtttls_set", "mqtttls_set", True),
+    ("mqttusername", "mqttusername", False),
+    ("mqttpassword", "mqttpassword", False),
+    ("mqttclient_id", "mqttclient_id", False),
+    ("mqttsend_on_event", "mqttsend_on_event", True),
+    ("mqttwrite_outputs", "mqttwrite_outputs", True),
+    # PLCSERVER Sektion
+    ("plcslave", "plcserver", True),
+    ("plcslavebindip", "plcserverbindip", False),
+    ("plcslaveport", "plcserverport", False),
+    ("plcslavewatchdog", "plcwatchdog", True),
+    # XMLRPC Sektion
+    ("xmlrpc", "xmlrpc", True),
+    ("xmlrpcbindip", "xmlrpcbindip", False),
+    ("xmlrpcintrospection", "xmlrpcintrospection", True),
+)
+
+# Werte fuer _loadconfig (Attribut, Schluessel, ConfigParser Getter, Standard)
+_CONFIG_LOAD = {
+    "DEFAULT": (
+        ("autoreload", "autoreload", "getboolean", True),
+        ("autoreloaddelay", "autoreloaddelay", "getint", 5),
+        ("autostart", "autostart", "getboolean", False),
+        ("plcworkdir", "plcworkdir", "get", "."),
+        ("plcprogram", "plcprogram", "get", "none.py"),
+        ("plcprogram_stop_timeout", "plcprogram_stop_timeout", "getint", 5),
+        ("plcprogram_watchdog", "plcprogram_watchdog", "getint", 0),
+        ("plcarguments", "plcarguments", "get", ""),
+        ("plcworkdir_set_uid", "plcworkdir_set_uid", "getboolean", False),
+        ("plcuid", "plcuid", "getint", 65534),
+        ("plcgid", "plcgid", "getint", 65534),
+        ("pythonversion", "pythonversion", "getint", 3),
+        ("replace_ios_config", "replace_ios", "get", ""),
+        ("rtlevel", "rtlevel", "getint", 0),
+        ("reset_driver_action", "reset_driver_action", "getint", 2),
+        ("zeroonerror", "zeroonerror", "getboolean", True),
+        ("zeroonexit", "zeroonexit", "getboolean", True),
+    ),
+    "MQTT": (
+        ("mqtt", "mqtt", "getboolean", False),
+        ("mqttbasetopic", "basetopic", "get", ""),
+        ("mqttsendinterval", "sendinterval", "getint", 30),
+        ("mqttbroker_address", "broker_address", "get", "localhost"),
+        ("mqttport", "port", "getint", 1883),
+        ("mqtttls_set", "tls_set", "getboolean", False),
+        ("mqttusername", "username", "get", ""),
+        ("mqttpassword", "password", "get", ""),
+        ("mqttclient_id", "client_id", "get", ""),
+        ("mqttsend_on_event", "send_on_event", "getboolean", False),
+        ("mqttwrite_outputs", "write_outputs", "getboolean", False),
+    ),
+}
+
+# Namen des XML-RPC Protokolls fuer xml_setconfig umbenennen
+_SETCONFIG_RENAME = (
+    ("plcslave", "plcserver"),
+    ("plcslaveacl", "plcserveracl"),
+    ("plcslavebindip", "plcserverbindip"),
+    ("plcslaveport", "plcserverport"),
+    ("plcslavewatchdog", "plcserverwatchdog"),
+)
+
+
+def _is_digits(value, maxlen=None):
+    """Prueft auf eine Zahl aus ASCII Ziffern wie RegEx [0-9]+.
+
+    @param value Wert als <class 'str'>
+    @param maxlen Maximale Anzahl Ziffern, dann ist auch "" erlaubt ([0-9]{,n})
+    @return True, wenn Format gueltig ist
+
+    """
+    # str.isascii() gibt es erst ab Python 3.7
+    if maxlen is not None and len(value) > maxlen:
+        return False
+    if value == "":
+        return maxlen is not None
+    return all(c in "0123456789" for c in value)
+
+
+def _is_line(value):
+    """Prueft auf eine Zeile ohne Umbruch wie RegEx .* (auch leer)."""
+    return "\n" not in value
+
+
+def _is_nonempty_line(value):
+    """Prueft auf eine nicht leere Zeile ohne Umbruch wie RegEx .+ ."""
+    return value != "" and "\n" not in value
+
+
+# Zeichenklassen wie [01] als Mengenvergleich statt RegEx pruefen
+_BOOL01 = frozenset(("0", "1")).__contains__
+
+# Gueltige Werte fuer xml_setconfig, die ACL Pruefung ergaenzt __init__()
+_CONFIG_SCHEMA = {
+    "DEFAULT": {
+        "autoreload": _BOOL01,
+        "autoreloaddelay": _is_digits,
+        "autostart": _BOOL01,
+        "plcprogram": _is_nonempty_line,
+        "plcprogram_stop_timeout": _is_digits,
+        "plcprogram_watchdog": _is_digits,
+        "plcarguments": _is_line,
+        "plcworkdir_set_uid": _BOOL01,
+        "pythonversion": frozenset(("2", "3")).__contains__,
+        "replace_ios": _is_line,
+        "reset_driver_action": frozenset(("0", "1", "2")).__contains__,
+        "rtlevel": _BOOL01,
+        "zeroonerror": _BOOL01,
+        "zeroonexit": _BOOL01,
+    },
+    "MQTT": {
+        "mqtt": _BOOL01,
+        "mqttbasetopic": _is_line,
+        "mqttsendinterval": _is_digits,
+        "mqttbroker_address": _is_nonempty_line,
+        "mqttport": _is_digits,
+        "mqtttls_set": _BOOL01,
+        "mqttusername": _is_line,
+        "mqttpassword": _is_line,
+        "mqttclient_id": _is_line,
+        "mqttsend_on_event": _BOOL01,
+        "mqttwrite_outputs": _BOOL01,
+    },
+    "PLCSERVER": {
+        "plcserver": _BOOL01,
+        "plcserverport": lambda value: _is_digits(value, 5),
+        "plcserverwatchdog": _BOOL01,
+    },
+    "XMLRPC": {
+        "xmlrpc": _BOOL01,
+        "xmlrpcintrospection": _BOOL01,
+    },
+}
+
 
 class RevPiPyLoad:
     """Hauptklasse, die alle Funktionen zur Verfuegung stellt.
@@ -64,18 +229,35 @@ class RevPiPyLoad:
 
     """
 
+    # Threads, die der mainloop neu startet, wenn sie nicht mehr laufen
+    # (Thread Attribut, Factory Methode, Konfigurationsattribut, Bezeichnung,
+    # Warnung nach Dateiveränderung unterdrücken)
+    _RESTART_THREADS = (
+        ("th_plcmqtt", "_plcmqtt", "mqtt", "mqtt publisher", False),
+        ("th_plcserver", "_plcserver", "plcserver", "plc server", True),
+    )
+
     def __init__(self):
         """Instantiiert RevPiPyLoad-Klasse."""
         proginit.logger.debug("enter RevPiPyLoad.__init__()")
 
         # Klassenattribute
         self._exit = True
+        self._lock = RLock()
         self.evt_loadconfig = Event()
+        self._wake_rfd, self._wake_wfd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._filewatcher = FileChangeWatcher()
         self.globalconfig = ConfigParser()
         proginit.conf = self.globalconfig
         self.logr = logsystem.LogReader()
         self.xsrv = None
         self.xml_ps = None
+        self._config_snapshot = {}
+        self._download_fds = {}
+        self._download_lock = Lock()
+        self._pictoryrsc_cache = (None, b"")
+        self._procimg_fd = None
+        self._procimg_size = 0
 
         # Generate version number for RevPi Commander, it will parse each part via int()
         version_match = search(r"(\d+\.){2}\d+", __version__)
@@ -95,10 +277,20 @@ class RevPiPyLoad:
             self.plcserveracl = IpAclManager(minlevel=0, maxlevel=1)
             self.xmlrpcacl = IpAclManager(minlevel=0, maxlevel=4)
 
+        # ACL Prüfung hängt von den Leveln der Berechtigungsmanager ab
+        self._config_schema = {
+            section: dict(fields) for section, fields in _CONFIG_SCHEMA.items()
+        }
+        self._config_schema["PLCSERVER"]["plcserveracl"] = \
+            self.plcserveracl.check_acl
+        self._config_schema["XMLRPC"]["xmlrpcacl"] = \
+            self.xmlrpcacl.check_acl
+
         # Threads/Prozesse
         self.th_plcmqtt = None
         self.th_plcserver = None
         self.plc = None
+        self._last_liveness_check = 0.0
 
         # Konfiguration laden
         self._loadconfig()
@@ -131,14 +323,74 @@ class RevPiPyLoad:
                     ("watchdog", "watchdog"),
             ):
                 if old_name in self.globalconfig["PLCSLAVE"]:
-                    self.globalconfig["PLCSERVER"][new_name] = self.globalconfig["PLCSLAVE"][old_name]
+                    # Rohwert kopieren, damit %% Maskierungen erhalten bleiben
+                    self.globalconfig["PLCSERVER"][new_name] = \
+                        self.globalconfig.get("PLCSLAVE", old_name, raw=True)
 
             self.globalconfig.remove_section("PLCSLAVE")
 
-            with open(proginit.globalconffile, "w") as fh:
-                self.globalconfig.write(fh)
+            self._write_globalconfig()
             proginit.logger.info("renamed obsolet config values in {0}".format(proginit.globalconffile))
 
+    def _write_globalconfig(self):
+        """Schreibt globalconfig atomar in die Konfigurationsdatei.
+
+        Die Werte werden in eine temporaere Datei geschrieben, die danach die
+        alte Datei ersetzt. Bei Stromausfall bleibt so immer eine gueltige
+        Konfiguration erhalten.
+
+        """
+        conffile = os.path.realpath(proginit.globalconffile)
+        tmpfile = conffile + ".tmp"
+
+        try:
+            with open(tmpfile, "w") as fh:
+                # Rechte und Besitzer der alten Datei übernehmen
+                if os.path.exists(conffile):
+                    st = os.stat(conffile)
+                    os.fchmod(fh.fileno(), st.st_mode & 0o7777)
+                    try:
+                        os.fchown(fh.fileno(), st.st_uid, st.st_gid)
+                    except PermissionError:
+                        # Ohne root Rechte bleibt der eigene Besitzer
+                        pass
+
+                self.globalconfig.write(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmpfile, conffile)
+        except Exception:
+            # Keine halb geschriebene Datei für den nächsten Aufruf liegen lassen
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+            raise
+
+        # Neuen Verzeichniseintrag sichern
+        dir_fd = os.open(os.path.dirname(conffile), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _update_config_snapshot(self):
+        """Erzeugt die Konfiguration fuer xml_getconfig neu."""
+        dc = {
+            key: int(getattr(self, attr)) if as_int else getattr(self, attr)
+            for key, attr, as_int in _CONFIG_FIELDS
+        }
+
+        # Werte, die angepasst werden müssen
+        dc["replace_ios"] = self.replace_ios_config.replace(
+            self.plcworkdir + "/", "")
+        dc["plcslaveacl"] = self.plcserveracl.acl
+        dc["xmlrpcacl"] = self.xmlrpcacl.acl
+
+        self._config_snapshot = dc
+        if self.xsrv is not None:
+            self.xsrv.set_cached_response("get_config", dc)
+
     def _check_mustrestart_mqtt(self):
         """Prueft ob sich kritische Werte veraendert haben.
         @return True, wenn Subsystemneustart noetig ist"""
@@ -185,19 +437,28 @@ class RevPiPyLoad:
         if self.plc is None:
             return True
         else:
-            return self.plcworkdir != self.globalconfig["DEFAULT"].get("plcworkdir", ".") \
-                or self.plcprogram != self.globalconfig["DEFAULT"].get("plcprogram", "none.py") \
-                or self.plcarguments != self.globalconfig["DEFAULT"].get("plcarguments", "") \
-                or self.plcuid != self.globalconfig["DEFAULT"].getint("plcuid", 65534) \
-                or self.plcgid != self.globalconfig["DEFAULT"].getint("plcgid", 65534) \
-                or self.pythonversion != self.globalconfig["DEFAULT"].getint("pythonversion", 3) \
-                or self.rtlevel != self.globalconfig["DEFAULT"].getint("rtlevel", 0) \
+            default = self.globalconfig["DEFAULT"]
+            return self.plcworkdir != default.get("plcworkdir", ".") \
+                or self.plcprogram != default.get("plcprogram", "none.py") \
+                or self.plcarguments != default.get("plcarguments", "") \
+                or self.plcuid != default.getint("plcuid", 65534) \
+                or self.plcgid != default.getint("plcgid", 65534) \
+                or self.pythonversion != default.getint("pythonversion", 3) \
+                or self.rtlevel != default.getint("rtlevel", 0) \
                 or (
                         not self.plc.is_alive()
                         and not self.autostart
-                        and self.globalconfig["DEFAULT"].getboolean("autostart", False)
+                        and default.getboolean("autostart", False)
                 )
 
+    def _load_section(self, section):
+        """Uebernimmt die Werte einer Sektion laut _CONFIG_LOAD.
+        @param section Name der Sektion"""
+        for attr, key, getter, fallback in _CONFIG_LOAD[section]:
+            setattr(self, attr, getattr(self.globalconfig, getter)(
+                section, key, fallback=fallback
+            ))
+
     def _loadconfig(self):
         """Load configuration file and setup modul."""
         proginit.logger.debug("enter RevPiPyLoad._loadconfig()")
@@ -219,42 +480,14 @@ class RevPiPyLoad:
         restart_plcprogram = self._check_mustrestart_plcprogram()
 
         # Konfiguration verarbeiten [DEFAULT]
-        self.autoreload = self.globalconfig["DEFAULT"].getboolean(
-            "autoreload", True)
-        self.autoreloaddelay = self.globalconfig["DEFAULT"].getint(
-            "autoreloaddelay", 5)
-        self.autostart = self.globalconfig["DEFAULT"].getboolean(
-            "autostart", False)
-        self.plcworkdir = self.globalconfig["DEFAULT"].get(
-            "plcworkdir", ".")
-        self.plcprogram = self.globalconfig["DEFAULT"].get(
-            "plcprogram", "none.py")
-        self.plcprogram_stop_timeout = self.globalconfig.getint(
-            "DEFAULT", "plcprogram_stop_timeout", fallback=5)
-        self.plcprogram_watchdog = self.globalconfig["DEFAULT"].getint(
-            "plcprogram_watchdog", 0)
-        self.plcarguments = self.globalconfig["DEFAULT"].get(
-            "plcarguments", "")
-        self.plcworkdir_set_uid = self.globalconfig["DEFAULT"].getboolean(
-            "plcworkdir_set_uid", False)
-        self.plcuid = self.globalconfig["DEFAULT"].getint(
-            "plcuid", 65534)
-        self.plcgid = self.globalconfig["DEFAULT"].getint(
-            "plcgid", 65534)
-        self.pythonversion = self.globalconfig["DEFAULT"].getint(
-            "pythonversion", 3)
-        self.replace_ios_config = self.globalconfig["DEFAULT"].get(
-            "replace_ios", "")
-        self.rtlevel = self.globalconfig["DEFAULT"].getint(
-            "rtlevel", 0)
-        self.reset_driver_action = self.globalconfig["DEFAULT"].getint(
-            "reset_driver_action", 2)
-        self.zeroonerror = self.globalconfig["DEFAULT"].getboolean(
-            "zeroonerror", True)
-        self.zeroonexit = self.globalconfig["DEFAULT"].getboolean(
-            "zeroonexit", True)
-
-        # Dateiveränderungen prüfen
+        self._load_section("DEFAULT")
+
+        # Dateiveränderungen prüfen, relativer Pfad gilt ab plcworkdir
+        self._filewatcher.watch(
+            proginit.pargs.configrsc,
+            self.replace_ios_config
+            and os.path.join(self.plcworkdir, self.replace_ios_config),
+        )
         file_changed = False
         # Beide Funktionen müssen einmal aufgerufen werden
         if self.check_pictory_changed():
@@ -267,17 +500,7 @@ class RevPiPyLoad:
             restart_plcprogram = True
 
         # Konfiguration verarbeiten [MQTT]
-        self.mqtt = self.globalconfig.getboolean("MQTT", "mqtt", fallback=False)
-        self.mqttbasetopic = self.globalconfig.get("MQTT", "basetopic", fallback="")
-        self.mqttsendinterval = self.globalconfig.getint("MQTT", "sendinterval", fallback=30)
-        self.mqttbroker_address = self.globalconfig.get("MQTT", "broker_address", fallback="localhost")
-        self.mqttport = self.globalconfig.getint("MQTT", "port", fallback=1883)
-        self.mqtttls_set = self.globalconfig.getboolean("MQTT", "tls_set", fallback=False)
-        self.mqttusername = self.globalconfig.get("MQTT", "username", fallback="")
-        self.mqttpassword = self.globalconfig.get("MQTT", "password", fallback="")
-        self.mqttclient_id = self.globalconfig.get("MQTT", "client_id", fallback="")
-        self.mqttsend_on_event = self.globalconfig.getboolean("MQTT", "send_on_event", fallback=False)
-        self.mqttwrite_outputs = self.globalconfig.getboolean("MQTT", "write_outputs", fallback=False)
+        self._load_section("MQTT")
 
         # Konfiguration verarbeiten [PLCSERVER]
         self.plcserver = self.globalconfig.getboolean("PLCSERVER", "plcserver", fallback=False)
@@ -319,12 +542,15 @@ class RevPiPyLoad:
             self.xmlrpcbindip = "127.0.0.1"
 
         self.xmlrpcport = self.globalconfig.getint("XMLRPC", "port", fallback=55123)
+        self.xmlrpcintrospection = self.globalconfig.getboolean(
+            "XMLRPC", "introspection", fallback=True)
 
         # Workdirectory wechseln
         if not os.access(self.plcworkdir, os.R_OK | os.W_OK | os.X_OK):
             raise ValueError(
                 "can not access plcworkdir '{0}'".format(self.plcworkdir)
             )
+        self._plcworkdir_real = os.path.realpath(self.plcworkdir)
         os.chdir(self.plcworkdir)
 
         # Workdirectory owner setzen
@@ -391,13 +617,16 @@ class RevPiPyLoad:
                 (self.xmlrpcbindip, self.xmlrpcport),
                 logRequests=False,
                 allow_none=True,
-                ipacl=self.xmlrpcacl
+                ipacl=self.xmlrpcacl,
+                lock=self._lock,
             )
-            self.xsrv.register_introspection_functions()
+            if self.xmlrpcintrospection:
+                self.xsrv.register_introspection_functions()
             self.xsrv.register_multicall_functions()
 
             # Allgemeine Funktionen
             self.xsrv.register_function(0, lambda: self._pyload_version, "version")
+            self.xsrv.set_cached_response("version", self._pyload_version)
             self.xsrv.register_function(0, lambda acl: acl, "xmlmodus")
 
             # XML Modus 1 Nur Logs lesen und PLC Programm neu starten
@@ -419,6 +648,8 @@ class RevPiPyLoad:
                 0, self.xml_mqttrunning, "mqttrunning")
             self.xsrv.register_function(
                 0, self.xml_plcserverrunning, "plcslaverunning")
+            self.xsrv.register_function(
+                0, self.xml_getstatus, "get_status")
 
             # Erweiterte Funktionen anmelden
             try:
@@ -446,13 +677,22 @@ class RevPiPyLoad:
             self.xsrv.register_function(
                 2, self.xml_getconfig, "get_config")
             self.xsrv.register_function(
-                2, self.xml_getfilelist, "get_filelist")
+                2, self.xml_getfilelist, "get_filelist", concurrent=True)
             self.xsrv.register_function(
-                2, self.xml_getpictoryrsc, "get_pictoryrsc")
+                2, self.xml_getpictoryrsc, "get_pictoryrsc", concurrent=True)
             self.xsrv.register_function(
                 2, self.xml_getprocimg, "get_procimg")
             self.xsrv.register_function(
-                2, self.xml_plcdownload, "plcdownload")
+                2, self.xml_plcdownload, "plcdownload", concurrent=True)
+            self.xsrv.register_function(
+                2, self.xml_plcdownload_chunked, "plcdownload_chunked",
+                concurrent=True)
+            self.xsrv.register_function(
+                2, self.xml_plcdownload_chunk, "plcdownload_chunk",
+                concurrent=True)
+            self.xsrv.register_function(
+                2, self.xml_plcdownload_done, "plcdownload_done",
+                concurrent=True)
 
             # XML Modus 3 Programm und Konfiguration hochladen
             self.xsrv.register_function(
@@ -472,7 +712,8 @@ class RevPiPyLoad:
             self.xsrv.register_function(
                 3, self.xml_plcdelete_file, "plcdeletefile")
             self.xsrv.register_function(
-                3, self.xml_plcdownload_file, "plcdownload_file")
+                3, self.xml_plcdownload_file, "plcdownload_file",
+                concurrent=True)
 
             # XML Modus 4 Einstellungen ändern
             self.xsrv.register_function(
@@ -491,6 +732,7 @@ class RevPiPyLoad:
                 self.xsrv.server_activate()
 
         # Konfiguration abschließen
+        self._update_config_snapshot()
         self.evt_loadconfig.clear()
 
         proginit.logger.debug("leave RevPiPyLoad._loadconfig()")
@@ -540,10 +782,11 @@ class RevPiPyLoad:
         proginit.logger.debug("enter RevPiPyLoad._plcthread()")
 
         # Prüfen ob Programm existiert
-        if not os.path.exists(os.path.join(self.plcworkdir, self.plcprogram)):
-            proginit.logger.error("plc file does not exists {0}".format(
-                os.path.join(self.plcworkdir, self.plcprogram)
-            ))
+        plc_path = os.path.join(self.plcworkdir, self.plcprogram)
+        if not os.path.exists(plc_path):
+            proginit.logger.error(
+                "plc file does not exists {0}".format(plc_path)
+            )
             return None
 
         # Check software watchdog
@@ -556,7 +799,7 @@ class RevPiPyLoad:
 
         proginit.logger.debug("create PLC program watcher")
         th_plc = plcsystem.RevPiPlc(
-            os.path.join(self.plcworkdir, self.plcprogram),
+            plc_path,
             self.plcarguments,
             self.pythonversion
         )
@@ -590,6 +833,67 @@ class RevPiPyLoad:
         proginit.logger.debug("leave RevPiPyLoad._plcserver()")
         return th_plc
 
+    def _wait_mainloop(self, timeout):
+        """Bearbeitet XML-RPC Anfragen bis timeout oder Wecksignal.
+        @param timeout Maximale Wartezeit in Sekunden"""
+        lst_fds = [self._wake_rfd]
+        if self._filewatcher.fd is not None:
+            lst_fds.append(self._filewatcher.fd)
+        if self.xmlrpc and self.xsrv is not None:
+            lst_fds.append(self.xsrv)
+
+        end_time = monotonic() + timeout
+        while not self._exit:
+            remaining = end_time - monotonic()
+            if remaining <= 0:
+                break
+
+            lst_ready = select(lst_fds, [], [], remaining)[0]
+            if self._wake_rfd in lst_ready:
+                # Pipe leeren, der mainloop wertet das Wecksignal aus
+                try:
+                    while os.read(self._wake_rfd, 64):
+                        pass
+                except BlockingIOError:
+                    pass
+                break
+            if self._filewatcher.fd in lst_ready \
+                    and self._filewatcher.read():
+                # Geänderte Dateien sofort im mainloop auswerten
+                break
+            if self.xsrv in lst_ready:
+                self.xsrv.handle_request()
+
+    def _wakeup(self):
+        """Beendet die Wartezeit im mainloop sofort."""
+        try:
+            os.write(self._wake_wfd, b"\x00")
+        except BlockingIOError:
+            # Pipe ist voll, der mainloop wird ohnehin geweckt
+            pass
+
+    def _restart_plcprogram_after_reset(self, reset_driver_detected, file_changed):
+        """Startet das PLC Programm nach 'reset driver' von piCtory neu.
+
+        @param reset_driver_detected piCtory 'reset driver' wurde erkannt
+        @param file_changed piCtory oder replace_ios Datei wurde geaendert
+
+        """
+        if not (self.reset_driver_action == 2 and reset_driver_detected
+                or self.reset_driver_action == 1 and file_changed):
+            return
+        if self.plc is None or not self.plc.is_alive():
+            return
+
+        # Plc program is running and we have to restart it
+        proginit.logger.warning(
+            "restart plc program after 'reset driver' was requested"
+        )
+        self.stop_plcprogram()
+        self.plc = self._plcthread()
+        if self.plc is not None:
+            self.plc.start()
+
     def _sigexit(self, signum, frame):
         """Signal handler to clean and exit program."""
         proginit.logger.debug("enter RevPiPyLoad._sigexit()")
@@ -600,6 +904,7 @@ class RevPiPyLoad:
         """Signal handler to load configuration."""
         proginit.logger.debug("enter RevPiPyLoad._sigloadconfig()")
         self.evt_loadconfig.set()
+        self._wakeup()
         proginit.logger.debug("leave RevPiPyLoad._sigloadconfig()")
 
     def _signewlogfile(self, signum, frame):
@@ -714,45 +1019,65 @@ class RevPiPyLoad:
         """
         proginit.logger.debug("enter RevPiPyLoad.packapp()")
 
-        tup_file = mkstemp(suffix="_packed", prefix="plc_")
-        filename = tup_file[1]
+        # Absolute Pfade, ein reload ändert das Arbeitsverzeichnis
+        with self._lock:
+            arcdir = os.path.basename(self.plcworkdir)
+            workdir = self._plcworkdir_real
 
-        if mode == "zip":
-            fh_pack = zipfile.ZipFile(filename, mode="w")
-            wd = os.walk("./")
-            try:
-                for tup_dir in wd:
-                    if tup_dir[0].find("__pycache__") != -1:
-                        continue
-                    for file in tup_dir[2]:
-                        arcname = os.path.join(
-                            os.path.basename(self.plcworkdir),
-                            tup_dir[0][2:],
-                            file
-                        )
-                        fh_pack.write(
-                            os.path.join(tup_dir[0], file), arcname=arcname
-                        )
-                if pictory and os.access(proginit.pargs.configrsc, os.R_OK):
-                    fh_pack.write(
-                        proginit.pargs.configrsc, arcname="config.rsc"
-                    )
-            except Exception:
-                filename = ""
-            finally:
-                fh_pack.close()
+        def in_workdir(path):
+            """Symlinks nur einpacken, wenn das Ziel in workdir liegt."""
+            real = os.path.realpath(path)
+            if os.path.commonpath((real, workdir)) == workdir:
+                return True
+            proginit.logger.warning(
+                "skip '{0}', target is not in plc working directory"
+                "".format(path)
+            )
+            return False
 
-        else:
-            fh_pack = tarfile.open(
-                name=filename, mode="w:gz", dereference=True)
+        def tar_filter(tarinfo):
+            """Wendet in_workdir auf den Quellpfad im workdir an."""
+            path = os.path.join(workdir, tarinfo.name[len(arcdir):].lstrip("/"))
+            return tarinfo if in_workdir(path) else None
+
+        fd, filename = mkstemp(suffix="_packed", prefix="plc_")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                if mode == "zip":
+                    with zipfile.ZipFile(
+                            fh, mode="w", compression=zipfile.ZIP_STORED
+                    ) as fh_pack:
+                        for file in filter(in_workdir, iter_files(workdir)):
+                            fh_pack.write(file, arcname=os.path.join(
+                                arcdir, os.path.relpath(file, workdir)
+                            ))
+                        if pictory and \
+                                os.access(proginit.pargs.configrsc, os.R_OK):
+                            fh_pack.write(
+                                proginit.pargs.configrsc, arcname="config.rsc"
+                            )
+
+                else:
+                    # Schnellste Kompressionsstufe für die langsamen ARM CPUs
+                    with tarfile.open(
+                            fileobj=fh, mode="w:gz", compresslevel=1,
+                            dereference=True
+                    ) as fh_pack:
+                        fh_pack.add(
+                            workdir, arcname=arcdir, filter=tar_filter
+                        )
+                        if pictory and \
+                                os.access(proginit.pargs.configrsc, os.R_OK):
+                            fh_pack.add(
+                                proginit.pargs.configrsc, arcname="config.rsc"
+                            )
+        except Exception:
+            # Kein unvollständiges Archiv im Temp-Verzeichnis zurücklassen
             try:
-                fh_pack.add(".", arcname=os.path.basename(self.plcworkdir))
-                if pictory and os.access(proginit.pargs.configrsc, os.R_OK):
-                    fh_pack.add(proginit.pargs.configrsc, arcname="config.rsc")
-            except Exception:
-                filename = ""
-            finally:
-                fh_pack.close()
+                os.remove(filename)
+            except OSError:
+                pass
+            filename = ""
 
         proginit.logger.debug("leave RevPiPyLoad.packapp()")
         return filename
@@ -787,97 +1112,92 @@ class RevPiPyLoad:
 
         # mainloop
         while not self._exit:
-            # Neue Konfiguration laden
-            if self.evt_loadconfig.is_set():
-                proginit.logger.info("got reqeust to reload config")
-                self._loadconfig()
+            with self._lock:
+                # Neue Konfiguration laden
+                if self.evt_loadconfig.is_set():
+                    proginit.logger.info("got reqeust to reload config")
+                    self._loadconfig()
+
+                file_changed = False
+                reset_driver_detected = pictory_reset_driver.triggered
+                files_touched = self._filewatcher.changed()
+
+                # Dateiveränderungen prüfen mit beiden Funktionen!
+                if (reset_driver_detected or
+                    pictory_reset_driver.not_implemented and files_touched) and \
+                        self.check_pictory_changed():
+                    file_changed = True
+
+                    # Alle Verbindungen von ProcImgServer trennen
+                    if self.plcserver and self.th_plcserver is not None:
+                        self.th_plcserver.disconnect_all()
 
-            file_changed = False
-            reset_driver_detected = pictory_reset_driver.triggered
+                    proginit.logger.warning("piCtory configuration was changed")
 
-            # Dateiveränderungen prüfen mit beiden Funktionen!
-            if (reset_driver_detected or
-                pictory_reset_driver.not_implemented) and \
-                    self.check_pictory_changed():
-                file_changed = True
+                if files_touched and self.check_replace_ios_changed():
+                    if not file_changed:
+                        # Verbindungen von ProcImgServer trennen mit replace_ios
+                        if self.plcserver and self.th_plcserver is not None:
+                            self.th_plcserver.disconnect_replace_ios()
 
-                # Alle Verbindungen von ProcImgServer trennen
-                if self.plcserver and self.th_plcserver is not None:
-                    self.th_plcserver.disconnect_all()
+                    file_changed = True
+                    proginit.logger.warning("replace ios file was changed")
 
-                proginit.logger.warning("piCtory configuration was changed")
+                if file_changed:
+                    # Auf Dateiveränderung reagieren
 
-            if self.check_replace_ios_changed():
-                if not file_changed:
-                    # Verbindungen von ProcImgServer trennen mit replace_ios
-                    if self.plcserver and self.th_plcserver is not None:
-                        self.th_plcserver.disconnect_replace_ios()
-
-                file_changed = True
-                proginit.logger.warning("replace ios file was changed")
-
-            if file_changed:
-                # Auf Dateiveränderung reagieren
-
-                # MQTT Publisher neu laden
-                if self.mqtt and self.th_plcmqtt is not None:
-                    self.th_plcmqtt.reload_revpimodio()
-
-                # XML Prozessabbildserver neu laden
-                if self.xml_ps is not None:
-                    self.xml_psstop()
-                    self.xml_ps.loadrevpimodio()
-                    # Kein psstart um Reload im Client zu erzeugen
-
-            # Restart plc program after piCtory change
-            if not pictory_reset_driver.not_implemented and \
-                    self.plc is not None and self.plc.is_alive() and (
-                    self.reset_driver_action == 2 and reset_driver_detected or
-                    self.reset_driver_action == 1 and file_changed):
-                # Plc program is running and we have to restart it
-                proginit.logger.warning(
-                    "restart plc program after 'reset driver' was requested"
-                )
-                self.stop_plcprogram()
-                self.plc = self._plcthread()
-                self.plc.start()
+                    # MQTT Publisher neu laden
+                    if self.mqtt and self.th_plcmqtt is not None:
+                        self.th_plcmqtt.reload_revpimodio()
 
-            # MQTT Publisher Thread prüfen
-            if self.mqtt and self.th_plcmqtt is not None \
-                    and not self.th_plcmqtt.is_alive():
-                proginit.logger.warning(
-                    "restart mqtt publisher after thread was not running"
-                )
-                self.th_plcmqtt = self._plcmqtt()
-                if self.th_plcmqtt is not None:
-                    self.th_plcmqtt.start()
-
-            # PLC Server Thread prüfen
-            if self.plcserver and self.th_plcserver is not None \
-                    and not self.th_plcserver.is_alive():
-                if not file_changed:
-                    proginit.logger.warning(
-                        "restart plc server after thread was not running"
+                    # XML Prozessabbildserver neu laden
+                    if self.xml_ps is not None:
+                        self.xml_psstop()
+                        self.xml_ps.loadrevpimodio()
+                        # Kein psstart um Reload im Client zu erzeugen
+
+                # Restart plc program after piCtory change
+                if (reset_driver_detected or file_changed) \
+                        and not pictory_reset_driver.not_implemented:
+                    self._restart_plcprogram_after_reset(
+                        reset_driver_detected, file_changed
                     )
-                self.th_plcserver = self._plcserver()
-                if self.th_plcserver is not None:
-                    self.th_plcserver.start()
-
-            if self.xmlrpc and self.xsrv is not None:
-                # Work multiple xml calls in same thread until timeout
-                xml_start = time()
-                while time() - xml_start < 1.0:
-                    self.xsrv.handle_request()
-            else:
-                self.evt_loadconfig.wait(1.0)
+
+                # Threads nur alle 5 Sekunden oder nach Dateiveränderung prüfen
+                now = monotonic()
+                if file_changed or now - self._last_liveness_check >= 5.0:
+                    self._last_liveness_check = now
+
+                    # MQTT Publisher und PLC Server Thread prüfen
+                    for th_attr, factory, conf_attr, name, quiet_on_change \
+                            in self._RESTART_THREADS:
+                        th = getattr(self, th_attr)
+                        if not getattr(self, conf_attr) or th is None \
+                                or th.is_alive():
+                            continue
+
+                        if not (quiet_on_change and file_changed):
+                            proginit.logger.warning(
+                                "restart {0} after thread was not running"
+                                "".format(name)
+                            )
+                        th = getattr(self, factory)()
+                        setattr(self, th_attr, th)
+                        if th is not None:
+                            th.start()
+
+            # Work xml calls until timeout or wakeup, they run in own threads
+            self._wait_mainloop(1.0)
 
         proginit.logger.info("stopping revpipyload")
+        self._filewatcher.close()
 
         # Alle Sub-Systeme beenden
-        self.stop_plcprogram()
-        self.stop_plcmqtt()
-        self.stop_plcserver()
-        self.stop_xmlrpcserver()
+        with self._lock:
+            self.stop_plcprogram()
+            self.stop_plcmqtt()
+            self.stop_plcserver()
+            self.stop_xmlrpcserver()
 
         # Logreader schließen
         self.logr.closeall()
@@ -888,6 +1208,7 @@ class RevPiPyLoad:
         """Stop revpipyload."""
         proginit.logger.debug("enter RevPiPyLoad.stop()")
         self._exit = True
+        self._wakeup()
         proginit.logger.debug("leave RevPiPyLoad.stop()")
 
     def stop_plcmqtt(self):
@@ -937,94 +1258,85 @@ class RevPiPyLoad:
             proginit.logger.info("close xmlrpc-server")
             self.xsrv.server_close()
 
+        if self._procimg_fd is not None:
+            os.close(self._procimg_fd)
+            self._procimg_fd = None
+
+        # Nicht abgeschlossene Downloads verwerfen
+        with self._download_lock:
+            for fd in self._download_fds.values():
+                os.close(fd)
+            self._download_fds.clear()
+
         proginit.logger.debug("leave RevPiPyLoad.stop_xmlrpcserver()")
 
     def xml_getconfig(self):
         """Uebertraegt die RevPiPyLoad Konfiguration.
         @return dict() der Konfiguration"""
         proginit.logger.debug("xmlrpc call getconfig")
-        dc = {}
-
-        # DEFAULT Sektion
-        dc["autoreload"] = int(self.autoreload)
-        dc["autoreloaddelay"] = self.autoreloaddelay
-        dc["autostart"] = int(self.autostart)
-        dc["plcworkdir"] = self.plcworkdir
-        dc["plcworkdir_set_uid"] = int(self.plcworkdir_set_uid)
-        dc["plcprogram"] = self.plcprogram
-        dc["plcprogram_stop_timeout"] = self.plcprogram_stop_timeout
-        dc["plcprogram_watchdog"] = self.plcprogram_watchdog
-        dc["plcarguments"] = self.plcarguments
-        dc["plcuid"] = self.plcuid
-        dc["plcgid"] = self.plcgid
-        dc["pythonversion"] = self.pythonversion
-        dc["replace_ios"] = self.replace_ios_config.replace(
-            self.plcworkdir + "/", "")
-        dc["reset_driver_action"] = self.reset_driver_action
-        dc["rtlevel"] = self.rtlevel
-        dc["zeroonerror"] = int(self.zeroonerror)
-        dc["zeroonexit"] = int(self.zeroonexit)
-
-        # MQTT Sektion
-        dc["mqtt"] = int(self.mqtt)
-        dc["mqttbasetopic"] = self.mqttbasetopic
-        dc["mqttsendinterval"] = self.mqttsendinterval
-        dc["mqttbroker_address"] = self.mqttbroker_address
-        dc["mqttport"] = self.mqttport
-        dc["mqtttls_set"] = int(self.mqtttls_set)
-        dc["mqttusername"] = self.mqttusername
-        dc["mqttpassword"] = self.mqttpassword
-        dc["mqttclient_id"] = self.mqttclient_id
-        dc["mqttsend_on_event"] = int(self.mqttsend_on_event)
-        dc["mqttwrite_outputs"] = int(self.mqttwrite_outputs)
-
-        # PLCSERVER Sektion
-        dc["plcslave"] = int(self.plcserver)
-        dc["plcslaveacl"] = self.plcserveracl.acl
-        dc["plcslavebindip"] = self.plcserverbindip
-        dc["plcslaveport"] = self.plcserverport
-        dc["plcslavewatchdog"] = int(self.plcwatchdog)
-
-        # XMLRPC Sektion
-        dc["xmlrpc"] = int(self.xmlrpc)
-        dc["xmlrpcacl"] = self.xmlrpcacl.acl
-        dc["xmlrpcbindip"] = self.xmlrpcbindip
-
-        return dc
+        return dict(self._config_snapshot)
 
     def xml_getfilelist(self):
         """Uebertraegt die Dateiliste vom plcworkdir.
         @return list() mit Dateinamen"""
         proginit.logger.debug("xmlrpc call getfilelist")
-        lst_file = []
-        wd = os.walk("./")
-        for tup_dir in wd:
-            if tup_dir[0].find("__pycache__") != -1:
-                continue
-            for file in tup_dir[2]:
-                lst_file.append(os.path.join(tup_dir[0], file)[2:])
-        return lst_file
+        with self._lock:
+            workdir = self._plcworkdir_real
+        return [
+            os.path.relpath(file, workdir) for file in iter_files(workdir)
+        ]
 
     def xml_getpictoryrsc(self):
         """Gibt die config.rsc Datei von piCotry zurueck.
         @return xmlrpc.client.Binary()"""
         proginit.logger.debug("xmlrpc call getpictoryrsc")
-        with open(proginit.pargs.configrsc, "rb") as fh:
-            buff = fh.read()
-        return Binary(buff)
+
+        # Datei nur nach Veränderung neu lesen
+        st = os.stat(proginit.pargs.configrsc)
+        rsc_id = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._pictoryrsc_cache[0] != rsc_id:
+            with open(proginit.pargs.configrsc, "rb") as fh:
+                self._pictoryrsc_cache = (rsc_id, fh.read())
+
+        return Binary(self._pictoryrsc_cache[1])
 
     def xml_getprocimg(self):
         """Gibt die Rohdaten aus piControl0 zurueck.
         @return xmlrpc.client.Binary()"""
-        proginit.logger.debug("xmlrpc call getprocimg")
-        with open(proginit.pargs.procimg, "rb") as fh:
-            buff = fh.read()
-        return Binary(buff)
+        if self._procimg_fd is None:
+            # Keep file open for all following calls
+            self._procimg_fd = os.open(
+                proginit.pargs.procimg, os.O_RDONLY | os.O_CLOEXEC
+            )
+            # Character devices like piControl0 report a size of 0
+            self._procimg_size = os.fstat(self._procimg_fd).st_size or 4096
+        return Binary(os.pread(self._procimg_fd, self._procimg_size, 0))
+
+    def xml_getstatus(self):
+        """Gibt alle Statuswerte fuer zyklische Abfragen in einem Aufruf.
+
+        Clients, die weitere Werte zyklisch abfragen, sollten diese mit
+        system.multicall zusammen anfordern (xmlrpc.client.MultiCall),
+        damit nur eine HTTP Anfrage je Zyklus noetig ist.
+
+        @return dict() mit version, xmlmodus, autoreload, plcrunning,
+            plcexitcode, mqttrunning, plcslaverunning und pictorymtime
+
+        """
+        return {
+            "version": self._pyload_version,
+            "xmlmodus": self.xsrv.requestacl,
+            "autoreload": int(self.autoreload),
+            "plcrunning": self.xml_plcrunning(),
+            "plcexitcode": self.xml_plcexitcode(),
+            "mqttrunning": self.xml_mqttrunning(),
+            "plcslaverunning": self.xml_plcserverrunning(),
+            "pictorymtime": self.pictorymtime,
+        }
 
     def xml_mqttrunning(self):
         """Prueft ob MQTT Uebertragung noch lauft.
         @return True, wenn MQTT Uebertragung noch lauft"""
-        proginit.logger.debug("xmlrpc call mqttrunning")
         return False if self.th_plcmqtt is None \
             else self.th_plcmqtt.is_alive()
 
@@ -1064,11 +1376,24 @@ class RevPiPyLoad:
         :param file_name: File with full path relative to work directory
         :return: True on success
         """
-        file_name = os.path.join(self.plcworkdir, file_name)
+        with self._lock:
+            workdir = self._plcworkdir_real
+
+        # Build real path of directory, join will return last element, if absolute
+        file_name = os.path.join(workdir, file_name)
+        dirname = os.path.realpath(os.path.dirname(file_name))
+        basename = os.path.basename(file_name)
+        if basename in ("", ".", "..") \
+                or os.path.commonpath((dirname, workdir)) != workdir:
+            proginit.logger.warning(
+                "file path is not in plc working directory"
+            )
+            return False
+
+        file_name = os.path.join(dirname, basename)
         if os.path.exists(file_name):
             os.remove(file_name)
-            dirname = os.path.dirname(file_name)
-            if dirname != self.plcworkdir:
+            if dirname != workdir:
                 try:
                     # Try to remove directory, which will work if it is empty
                     os.rmdir(dirname)
@@ -1087,7 +1412,7 @@ class RevPiPyLoad:
         """
         proginit.logger.debug("xmlrpc call plcdownload")
 
-        # TODO: Daten einzeln übertragen
+        # Große Archive blockweise mit plcdownload_chunked übertragen
 
         file = self.packapp(mode, pictory)
         if os.path.exists(file):
@@ -1097,6 +1422,86 @@ class RevPiPyLoad:
             return xmldata
         return Binary()
 
+    def xml_plcdownload_chunked(self, mode="tar", pictory=False):
+        """Erzeugt ein Archiv vom plcworkdir fuer blockweise Uebertragung.
+
+        Das Archiv wird mit plcdownload_chunk(token, offset) abgeholt und
+        mit plcdownload_done(token) freigegeben.
+
+        @param mode Archivart 'tar' 'zip'
+        @param pictory piCtory Konfiguraiton mit einpacken
+        @return list() [token, Dateigroesse, Blockgroesse], token "" bei
+            Fehler
+
+        """
+        proginit.logger.debug("xmlrpc call plcdownload_chunked")
+
+        file = self.packapp(mode, pictory)
+        if not os.path.exists(file):
+            return ["", 0, 0]
+
+        # Datei bleibt über den Deskriptor bis plcdownload_done erhalten
+        fd = os.open(file, os.O_RDONLY | os.O_CLOEXEC)
+        os.remove(file)
+
+        token = os.urandom(8).hex()
+        size = os.fstat(fd).st_size
+        with self._download_lock:
+            # Älteste offene Downloads von abgebrochenen Clients verwerfen
+            while len(self._download_fds) >= _DOWNLOAD_MAXOPEN:
+                os.close(self._download_fds.pop(next(iter(self._download_fds))))
+
+            self._download_fds[token] = fd
+        return [token, size, _DOWNLOAD_CHUNKSIZE]
+
+    def xml_plcdownload_chunk(self, token, offset, size=None):
+        """Liest einen Block eines Archivs von plcdownload_chunked.
+
+        Mehrere Bloecke koennen in einem system.multicall abgerufen werden.
+        Ein unbekannter token, auch nach Verwerfen fuer einen neueren
+        Download, loest ValueError aus.
+
+        @param token Token von plcdownload_chunked
+        @param offset Position im Archiv in Bytes
+        @param size Anzahl Bytes, maximal Blockgroesse (Standard)
+        @return Binary() mit bis zu size Bytes, leer am Ende
+
+        """
+        # XML-RPC boolean kommt als bool, das auch eine int Instanz ist
+        if not isinstance(offset, int) or isinstance(offset, bool):
+            raise TypeError("offset must be <class 'int'>")
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        if size is None:
+            size = _DOWNLOAD_CHUNKSIZE
+        elif not isinstance(size, int) or isinstance(size, bool):
+            raise TypeError("size must be <class 'int'>")
+        elif size < 1:
+            raise ValueError("size must be greater than 0")
+        else:
+            size = min(size, _DOWNLOAD_CHUNKSIZE)
+
+        # Lesen unter Lock, damit plcdownload_done den fd nicht schließt
+        with self._download_lock:
+            fd = self._download_fds.get(token)
+            if fd is None:
+                raise ValueError("unknown download token")
+            return Binary(os.pread(fd, size, offset))
+
+    def xml_plcdownload_done(self, token):
+        """Gibt ein Archiv von plcdownload_chunked frei.
+
+        @param token Token von plcdownload_chunked
+        @return True, wenn token bekannt war
+
+        """
+        with self._download_lock:
+            fd = self._download_fds.pop(token, None)
+            if fd is None:
+                return False
+            os.close(fd)
+        return True
+
     def xml_plcdownload_file(self, file_name: str):
         """
         Download a single file from work directory.
@@ -1104,7 +1509,17 @@ class RevPiPyLoad:
         :param file_name: File with full path relative to work directory
         :return: Binary object in gzip format
         """
-        file_name = os.path.join(self.plcworkdir, file_name)
+        with self._lock:
+            workdir = self._plcworkdir_real
+
+        # Build real path, join will return last element, if absolute
+        file_name = os.path.realpath(os.path.join(workdir, file_name))
+        if os.path.commonpath((file_name, workdir)) != workdir:
+            proginit.logger.warning(
+                "file path is not in plc working directory"
+            )
+            return Binary()
+
         if os.path.exists(file_name):
             with open(file_name, "rb") as fh:
                 xmldata = Binary(gzip.compress(fh.read()))
@@ -1131,7 +1546,6 @@ class RevPiPyLoad:
     def xml_plcrunning(self):
         """Prueft ob das PLC Programm noch lauft.
         @return True, wenn das PLC Programm noch lauft"""
-        proginit.logger.debug("xmlrpc call plcrunning")
         return False if self.plc is None else self.plc.is_alive()
 
     def xml_plcstart(self):
@@ -1185,9 +1599,13 @@ class RevPiPyLoad:
         # Windowszeichen prüfen
         filename = filename.replace("\\", "/")
 
-        # Build absolut path, join will return last element, if absolute
-        dirname = os.path.join(self.plcworkdir, os.path.dirname(filename))
-        if os.path.abspath(dirname).find(self.plcworkdir) != 0:
+        # Build real path, join will return last element, if absolute
+        dirname = os.path.join(
+            self._plcworkdir_real, os.path.dirname(filename)
+        )
+        if os.path.commonpath((
+                os.path.realpath(dirname), self._plcworkdir_real
+        )) != self._plcworkdir_real:
             proginit.logger.warning(
                 "file path is not in plc working directory"
             )
@@ -1198,9 +1616,9 @@ class RevPiPyLoad:
 
         # Set permissions only to newly created directories
         if not os.path.exists(dirname):
-            lst_subdir = dirname.replace(self.plcworkdir + "/", "").split("/")
+            lst_subdir = dirname.replace(self._plcworkdir_real + "/", "").split("/")
             for i in range(len(lst_subdir)):
-                dir_part = os.path.join(self.plcworkdir, *lst_subdir[:i + 1])
+                dir_part = os.path.join(self._plcworkdir_real, *lst_subdir[:i + 1])
                 if os.path.exists(dir_part):
                     # Do not change owner of existing directorys
                     continue
@@ -1209,20 +1627,36 @@ class RevPiPyLoad:
                 os.chown(dir_part, set_uid, set_gid)
 
         # Datei erzeugen
+        filename = os.path.join(self._plcworkdir_real, filename)
+        try:
+            fh = open(filename, "wb")
+        except Exception:
+            return False
+
+        try:
+            # Entpacken in 64 KiB Blöcken statt komplett im Speicher
+            with fh, gzip.GzipFile(fileobj=BytesIO(filedata.data)) as fh_gz:
+                copyfileobj(fh_gz, fh, 1 << 16)
+        except Exception:
+            # Keine halb entpackte Datei zurücklassen
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return False
+
         try:
-            with open(filename, "wb") as fh:
-                fh.write(gzip.decompress(filedata.data))
             os.chown(filename, set_uid, set_gid)
-            return True
         except Exception:
             return False
+        return True
 
     def xml_plcuploadclean(self):
         """Loescht das gesamte plcworkdir Verzeichnis.
         @return True, wenn erfolgreich"""
         proginit.logger.debug("xmlrpc call plcuploadclean")
         try:
-            rmtree(".", ignore_errors=True)
+            clear_directory(self._plcworkdir_real)
         except Exception:
             return False
         return True
@@ -1231,82 +1665,30 @@ class RevPiPyLoad:
         """Startet RevPiPyLoad neu und verwendet neue Konfiguraiton."""
         proginit.logger.debug("xmlrpc call reload")
         self.evt_loadconfig.set()
+        self._wakeup()
 
     def xml_setconfig(self, dc, loadnow=False):
         """Empfaengt die RevPiPyLoad Konfiguration.
         @return True, wenn erfolgreich angewendet"""
         proginit.logger.debug("xmlrpc call setconfig")
-        keys = {
-            "DEFAULT": {
-                "autoreload": "[01]",
-                "autoreloaddelay": "[0-9]+",
-                "autostart": "[01]",
-                "plcprogram": ".+",
-                "plcprogram_stop_timeout": "[0-9]+",
-                "plcprogram_watchdog": "[0-9]+",
-                "plcarguments": ".*",
-                "plcworkdir_set_uid": "[01]",
-                # "plcuid": "[0-9]{,5}",
-                # "plcgid": "[0-9]{,5}",
-                "pythonversion": "[23]",
-                "replace_ios": ".*",
-                "reset_driver_action": "[0-2]",
-                "rtlevel": "[0-1]",
-                "zeroonerror": "[01]",
-                "zeroonexit": "[01]",
-            },
-            "MQTT": {
-                "mqtt": "[01]",
-                "mqttbasetopic": ".*",
-                "mqttsendinterval": "[0-9]+",
-                "mqttbroker_address": ".+",
-                "mqttport": "[0-9]+",
-                "mqtttls_set": "[01]",
-                "mqttusername": ".*",
-                "mqttpassword": ".*",
-                "mqttclient_id": ".*",
-                "mqttsend_on_event": "[01]",
-                "mqttwrite_outputs": "[01]",
-            },
-            "PLCSERVER": {
-                "plcserver": "[01]",
-                "plcserveracl": self.plcserveracl.regex_acl,
-                # "plcserverbindip": "^((([\\d]{1,3}\\.){3}[\\d]{1,3})|\\*)+$",
-                "plcserverport": "[0-9]{,5}",
-                "plcserverwatchdog": "[01]",
-            },
-            "XMLRPC": {
-                "xmlrpc": "[01]",
-                "xmlrpcacl": self.xmlrpcacl.regex_acl,
-                # "xmlrpcbindip": "^((([\\d]{1,3}\\.){3}[\\d]{1,3})|\\*)+$",
-                # "xmlrpcport": "[0-9]{,5}",
-            }
-        }
-
         # Adjust values
         if dc.get("replace_ios", "") and dc["replace_ios"].find("/") == -1:
             dc["replace_ios"] = os.path.join(
                 self.plcworkdir, dc["replace_ios"])
 
         # Rename values due to compatibility with the xml-rpc protocol
-        for key_from, key_to in (
-                ("plcslave", "plcserver"),
-                ("plcslaveacl", "plcserveracl"),
-                ("plcslavebindip", "plcserverbindip"),
-                ("plcslaveport", "plcserverport"),
-                ("plcslavewatchdog", "plcserverwatchdog"),
-        ):
+        for key_from, key_to in _SETCONFIG_RENAME:
             if key_from in dc:
                 dc[key_to] = dc[key_from]
                 del dc[key_from]
 
         # Werte übernehmen, die eine Definition in key haben (andere nicht)
-        for sektion in keys:
+        for sektion, fields in self._config_schema.items():
             suffix = sektion.lower()
-            for key in keys[sektion]:
+            for key, fullmatch in fields.items():
                 if key in dc:
                     localkey = key.replace(suffix, "")
-                    if not refullmatch(keys[sektion][key], str(dc[key])):
+                    if not fullmatch(str(dc[key])):
                         proginit.logger.error(
                             "got wrong setting '{0}' with value '{1}'".format(
                                 key, dc[key]
@@ -1316,15 +1698,15 @@ class RevPiPyLoad:
                     if localkey != "acl":
                         if sektion not in self.globalconfig:
                             self.globalconfig.add_section(sektion)
+                        # Ein % wird beim Lesen interpoliert, also maskieren
                         self.globalconfig.set(
                             sektion,
                             key if localkey == "" else localkey,
-                            str(dc[key])
+                            str(dc[key]).replace("%", "%%")
                         )
 
         # conf-Datei schreiben
-        with open(proginit.globalconffile, "w") as fh:
-            self.globalconfig.write(fh)
+        self._write_globalconfig()
         proginit.conf = self.globalconfig
         proginit.logger.info(
             "got new config and wrote it to {0}"
@@ -1335,6 +1717,7 @@ class RevPiPyLoad:
         str_acl = dc.get("plcserveracl", None)
         if str_acl is not None and self.plcserveracl.acl != str_acl:
             self.plcserveracl.acl = str_acl
+            self._update_config_snapshot()
             if not self.plcserveracl.writeaclfile(aclname="PLC-SERVER"):
                 proginit.logger.error(
                     "can not write acl file '{0}' for PLC-SERVER"
@@ -1349,6 +1732,7 @@ class RevPiPyLoad:
         str_acl = dc.get("xmlrpcacl", None)
         if str_acl is not None and self.xmlrpcacl.acl != str_acl:
             self.xmlrpcacl.acl = str_acl
+            self._update_config_snapshot()
             if not self.xmlrpcacl.writeaclfile(aclname="XML-RPC"):
                 proginit.logger.error(
                     "can not write acl file '{0}' for XML-RPC"
@@ -1364,6 +1748,7 @@ class RevPiPyLoad:
         if loadnow:
             # RevPiPyLoad neu konfigurieren
             self.evt_loadconfig.set()
+            self._wakeup()
 
         return True
 
@@ -1384,6 +1769,7 @@ class RevPiPyLoad:
 
         # Set the new plc program setting to activ configuration
         self.plcprogram = plcprogram
+        self._update_config_snapshot()
 
         # Save the new value to config file without reload
         self.xml_setconfig({"plcprogram": plcprogram}, False)
@@ -1413,15 +1799,14 @@ class RevPiPyLoad:
 
         # Datei als JSON laden
         try:
-            jconfigrsc = jloads(filebytes.data.decode())
+            jconfigrsc = jloads(filebytes.data)
         except Exception:
             return -1
 
         # Elemente prüfen
-        lst_check = ["Devices", "Summary", "App"]
-        for chk in lst_check:
-            if chk not in jconfigrsc:
-                return -2
+        if not isinstance(jconfigrsc, dict) \
+                or not jconfigrsc.keys() >= {"Devices", "Summary", "App"}:
+            return -2
 
         # Prüfen ob Modulkatalog vorhanden ist
         if proginit.rapcatalog is None:
@@ -1430,14 +1815,13 @@ class RevPiPyLoad:
 
             # piCtory Device in Katalog suchen
             for picdev in jconfigrsc["Devices"]:
-                found = False
                 picdev = picdev["id"][7:-4]
-                for rapdev in proginit.rapcatalog:
-                    if rapdev.find(picdev) >= 0:
-                        found = True
+                if picdev in proginit.rapcatalog_ids:
+                    continue
 
-                # Device im Katalog nicht gefunden
-                if not found:
+                # Ohne exakten Treffer als Teilstring eines Namens suchen
+                if "\0" in picdev or picdev not in proginit.rapcatalog_blob:
+                    # Device im Katalog nicht gefunden
                     return -4
 
         try:
@@ -1472,7 +1856,6 @@ class RevPiPyLoad:
     def xml_plcserverrunning(self):
         """Prueft ob PLC-Server noch lauft.
         @return True, wenn PLC-Server noch lauft"""
-        proginit.logger.debug("xmlrpc call plcserverrunning")
         return False if self.th_plcserver is None \
             else self.th_plcserver.is_alive()
 
@@ -18,7 +18,7 @@ def main() -> int:
     """Secure installation script to use on Revolution Pi."""
     from configparser import ConfigParser
     from os import R_OK, access, getuid, system
-    from re import match
+    from re import compile as recompile
     from sys import stderr, stdout
 
     from .shared.ipaclmanager import IpAclManager
@@ -121,13 +121,14 @@ def main() -> int:
                 if cmd == "y":
                     # Always set local host
                     lst_ip = ["127.*.*.*,4 "]
+                    re_ip = recompile(r"([0-9*]{1,3}\.){3}[0-9*]{1,3}")
                     while True:
                         cmd = input("Enter single IPv4 address | Press RETURN to complete: ")
                         if not cmd:
                             xmlrpcacl.acl = " ".join(lst_ip)
                             save_xmlrpcacls()
                             break
-                        elif match(r"([\d*]{1,3}\.){3}[\d*]{1,3}", cmd):
+                        elif re_ip.fullmatch(cmd):
                             ip_level = "{0},4".format(cmd)
                             if ip_level not in lst_ip:
                                 lst_ip.append(ip_level)
@@ -5,20 +5,24 @@ __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 __version__ = "0.1.0"
 
-from os import R_OK, W_OK, access
-from re import match as rematch
+from re import compile as recompile, fullmatch as refull
+
+# Maximale Anzahl gemerkter IP Adressen mit ihrem ACL Level
+KNOWNIPS_MAX = 256
 
 
 def refullmatch(regex, string):
-    """re.fullmatch wegen alter python version aus wheezy nachgebaut.
+    """Prueft ob string komplett auf regex passt.
+
+    Nur noch fuer Aufrufer von aussen, re.fullmatch nutzt den Cache fuer
+    kompilierte Ausdruecke des re Moduls.
 
     @param regex RegEx Statement
     @param string Zeichenfolge gegen die getestet wird
     @return True, wenn komplett passt sonst False
 
     """
-    m = rematch(regex, string)
-    return m is not None and m.end() == len(string)
+    return refull(regex, string) is not None
 
 
 class IpAclManager():
@@ -32,9 +36,9 @@ class IpAclManager():
         @param acl ACL Liste fuer Berechtigungen als <class 'str'>
 
         """
-        if type(minlevel) != int:
+        if not isinstance(minlevel, int):
             raise ValueError("parameter minlevel must be <class 'int'>")
-        if type(maxlevel) != int:
+        if not isinstance(maxlevel, int):
             raise ValueError("parameter maxlevel must be <class 'int'>")
         if minlevel < 0:
             raise ValueError("minlevel must be 0 or more")
@@ -44,11 +48,15 @@ class IpAclManager():
             raise ValueError("minlevel is smaller than maxlevel")
 
         self.__dict_acl = {}
-        self.__dict_regex = {}
+        self.__minlevel = minlevel
+        self.__maxlevel = maxlevel
+        self.__levels = frozenset(
+            str(level) for level in range(minlevel, maxlevel + 1)
+        )
+        self.__dict_trie = {}
         self.__dict_knownips = {}
+        self.__lst_regex = []
         self.__filename = None
-        self.__re_ipacl = "(([\\d\\*]{1,3}\\.){3}[\\d\\*]{1,3},[" \
-                          + str(minlevel) + "-" + str(maxlevel) + "] ?)*"
 
         # Liste erstellen, wenn übergeben
         if acl is not None:
@@ -62,10 +70,10 @@ class IpAclManager():
     def __get_acl(self):
         """Getter fuer den rohen ACL-String.
         return ACLs als <class 'str'>"""
-        str_acl = ""
-        for aclip in sorted(self.__dict_acl):
-            str_acl += "{0},{1} ".format(aclip, self.__dict_acl[aclip])
-        return str_acl.strip()
+        return " ".join(
+            "{0},{1}".format(aclip, self.__dict_acl[aclip])
+            for aclip in sorted(self.__dict_acl)
+        )
 
     def __get_filename(self):
         """Getter fuer Dateinamen.
@@ -75,29 +83,104 @@ class IpAclManager():
     def __get_regex_acl(self):
         """Gibt formatierten RegEx-String zurueck.
         return RegEx Code als <class 'str'>"""
-        return self.__re_ipacl
+        # Nur noch für Aufrufer von außen, intern prüft check_acl()
+        return "(([\\d\\*]{1,3}\\.){3}[\\d\\*]{1,3},[" \
+            + str(self.__minlevel) + "-" + str(self.__maxlevel) + "] ?)*"
 
     def __set_acl(self, value):
         """Uebernimmt neue ACL-Liste fuer die Ausertung der Level.
         @param value Neue ACL-Liste als <class 'str'>"""
-        if type(value) != str:
+        if not isinstance(value, str):
             raise ValueError("parameter acl must be <class 'str'>")
 
         value = value.strip()
-        if not refullmatch(self.__re_ipacl, value):
+        if not self.check_acl(value):
             raise ValueError("acl format ist not okay - 1.2.3.4,0 5.6.7.8,1")
 
         # Klassenwerte übernehmen
         self.__dict_acl = {}
-        self.__dict_regex = {}
         self.__dict_knownips = {}
 
-        # Liste neu füllen mit regex Strings
+        # Liste neu füllen
         for ip_level in value.split():
             ip, level = ip_level.split(",", 1)
             self.__dict_acl[ip] = int(level)
-            self.__dict_regex[ip] = \
-                ip.replace(".", "\\.").replace("*", "\\d{1,3}")
+
+        # Platzhalter in einem Oktett (1* passt auf 10-19, 100-199) nur
+        # per RegEx in der Reihenfolge der alten Versionen prüfen
+        if any(
+                "*" in octet and octet != "*"
+                for aclip in self.__dict_acl for octet in aclip.split(".")):
+            self.__lst_regex = [
+                (
+                    recompile(
+                        aclip.replace(".", "\\.").replace("*", "\\d{1,3}")
+                    ).fullmatch,
+                    self.__dict_acl[aclip],
+                )
+                for aclip in sorted(self.__dict_acl, reverse=True)
+            ]
+        else:
+            self.__lst_regex = []
+
+        # Baum mit einer Ebene je Oktett für die Suche aufbauen
+        self.__dict_trie = {}
+        for aclip, level in self.__dict_acl.items():
+            node = self.__dict_trie
+            octets = aclip.split(".")
+            for octet in octets[:-1]:
+                node = node.setdefault(octet, {})
+            node[octets[-1]] = level
+
+    def __search_trie(self, node, octets, index):
+        """Sucht das Level ab einem Knoten, genaue Oktette vor Wildcard.
+
+        @param node Knoten im ACL Baum
+        @param octets Oktette der IP Adresse
+        @param index Position des zu pruefenden Oktetts
+        @return <class 'int'> ACL Wert oder -1 wenn nicht gefunden
+
+        """
+        for key in (octets[index], "*"):
+            if key not in node:
+                continue
+            if index == 3:
+                return node[key]
+            level = self.__search_trie(node[key], octets, index + 1)
+            if level != -1:
+                return level
+
+        return -1
+
+    def check_acl(self, str_acl):
+        """Prueft das Format eines ACL-Strings ohne RegEx.
+
+        Eintraege sind durch ein Leerzeichen getrennt, jedes Oktett hat 1-3
+        Zeichen aus Ziffern und *, das Level liegt zwischen minlevel und
+        maxlevel.
+
+        @param str_acl ACL als <class 'str'>
+        @return True, wenn Format gueltig ist
+
+        """
+        if not str_acl:
+            return True
+        if str_acl.endswith(" "):
+            str_acl = str_acl[:-1]
+
+        for ip_level in str_acl.split(" "):
+            ip, _, level = ip_level.partition(",")
+            if level not in self.__levels:
+                return False
+
+            octets = ip.split(".")
+            if len(octets) != 4:
+                return False
+            for octet in octets:
+                if not 0 < len(octet) < 4 or octet.strip("0123456789*"):
+                    return False
+
+        return True
 
     def get_acllevel(self, ipaddress):
         """Prueft IP gegen ACL List und gibt ACL-Wert aus.
@@ -107,21 +190,36 @@ class IpAclManager():
         if ipaddress in self.__dict_knownips:
             return self.__dict_knownips[ipaddress]
 
-        for aclip in sorted(self.__dict_acl, reverse=True):
-            if refullmatch(self.__dict_regex[aclip], ipaddress):
-                # IP und Level merken
-                self.__dict_knownips[ipaddress] = self.__dict_acl[aclip]
+        octets = ipaddress.split(".")
+        if len(octets) != 4 or not all(
+                0 < len(octet) < 4 and not octet.strip("0123456789")
+                for octet in octets):
+            return -1
+
+        level = -1
+        if self.__lst_regex:
+            for fullmatch, acl_level in self.__lst_regex:
+                if fullmatch(ipaddress):
+                    level = acl_level
+                    break
+        else:
+            level = self.__search_trie(self.__dict_trie, octets, 0)
 
-                # Level zurückgeben
-                return self.__dict_acl[aclip]
+        if level != -1:
+            # Speicher begrenzen, clear() ist auch für Threads sicher
+            if len(self.__dict_knownips) >= KNOWNIPS_MAX:
+                self.__dict_knownips.clear()
 
-        return -1
+            # IP und Level merken
+            self.__dict_knownips[ipaddress] = level
+
+        return level
 
     def loadacl(self, str_acl):
         """Laed ACL String und gibt erfolg zurueck.
         @param str_acl ACL als <class 'str'>
         @return True, wenn erfolgreich uebernommen"""
-        if not refullmatch(self.__re_ipacl, str_acl):
+        if not self.check_acl(str_acl):
             return False
         self.__set_acl(str_acl)
         return True
@@ -130,24 +228,26 @@ class IpAclManager():
         """Laed ACL Definitionen aus Datei.
         @param filename Dateiname fuer Definitionen
         @return True, wenn Laden erfolgreich war"""
-        if type(filename) != str:
+        if not isinstance(filename, str):
             raise ValueError("parameter filename must be <class 'str'>")
 
-        # Zugriffsrecht prüfen
-        if not access(filename, R_OK):
+        # Zugriffsrecht prüft open() selbst
+        try:
+            fh = open(filename, "r")
+        except OSError:
             return False
 
-        str_acl = ""
-        with open(filename, "r") as fh:
-            while True:
-                buff = fh.readline()
-                if buff == "":
-                    break
-                buff = buff.split("#")[0].strip()
-                if len(buff) > 0:
-                    str_acl += buff + " "
+        with fh:
+            buff = fh.read()
 
-        acl_okay = self.loadacl(str_acl.strip())
+        # Kommentare entfernen und Einträge mit Leerzeichen verbinden
+        lst_acl = []
+        for line in buff.splitlines():
+            line = line.partition("#")[0].strip()
+            if line:
+                lst_acl.append(line)
+
+        acl_okay = self.loadacl(" ".join(lst_acl))
         if acl_okay:
             # Dateinamen für Schreiben übernehmen
             self.__filename = filename
@@ -158,27 +258,35 @@ class IpAclManager():
         """Schreibt ACL Definitionen in Datei.
         @param filename Dateiname fuer Definitionen
         @return True, wenn Schreiben erfolgreich war"""
-        if filename is not None and type(filename) != str:
+        if filename is not None and not isinstance(filename, str):
             raise ValueError("parameter filename must be <class 'str'>")
-        if aclname is not None and type(aclname) != str:
+        if aclname is not None and not isinstance(aclname, str):
             raise ValueError("parameter aclname must be <class 'str'>")
 
         # Dateinamen prüfen
         if filename is None and self.__filename is not None:
             filename = self.__filename
 
-        # Zugriffsrecht prüfen
-        if not access(filename, W_OK):
+        # Zugriffsrecht prüft open() selbst, r+ legt keine Datei neu an
+        try:
+            fh = open(filename, "r+")
+        except OSError:
             return False
 
         header = "# {0}Access Control List (acl)\n" \
                  "# One entry per Line IPADRESS,LEVEL\n" \
                  "#\n".format("" if aclname is None else aclname + " ")
 
-        with open(filename, "w") as fh:
-            fh.write(header)
-            for aclip in sorted(self.__dict_acl):
-                fh.write("{0},{1}\n".format(aclip, self.__dict_acl[aclip]))
+        # Dateiinhalt mit einem Schreibvorgang ausgeben
+        lst_lines = [header]
+        lst_lines.extend(
+            "{0},{1}\n".format(aclip, self.__dict_acl[aclip])
+            for aclip in sorted(self.__dict_acl)
+        )
+
+        with fh:
+            fh.write("".join(lst_lines))
+            fh.truncate()
 
         return True
 
@@ -1,19 +1,32 @@
 # -*- coding: utf-8 -*-
-"""Watchdog systems to monitor plc program and reset_driver of piCtory."""
+"""Watchdog systems to monitor plc program, reset_driver and config files."""
 __author__ = "Sven Sager"
 __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 
 import os
+from ctypes import CDLL
 from fcntl import ioctl
 from random import random
-from struct import pack, unpack
+from struct import pack, unpack_from
 from subprocess import Popen
 from threading import Event, Thread
-from time import time
+from time import monotonic
 
 from . import proginit as pi
 
+# inotify events of directory entries, which change a watched file
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_MASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO \
+    | _IN_CREATE | _IN_DELETE
+
 
 class SoftwareWatchdog:
 
@@ -26,8 +39,9 @@ class SoftwareWatchdog:
         :param kill_process: Process to kill on trigger
         """
         self.__th = Thread()
+        self._address = 0
         self._exit = Event()
-        self._ioctl_bytes = b''
+        self._ioctl_bytes = bytearray(4)
         self._process = None
         self._stopped = False
         self._timeout = 0.0
@@ -50,25 +64,28 @@ class SoftwareWatchdog:
             return
 
         fd = os.open(pi.pargs.procimg, os.O_RDONLY)
-        mrk = self._ioctl_bytes
-        tmr = time()
+
+        mrk = 0
+        deadline = monotonic() + self._timeout
 
         # Random wait value 0.0-0.1 to become async to process image
         while not self._exit.wait(random() / 10):
             try:
-                # Get SoftWatchdog bit
-                bit_7 = ioctl(fd, 19215, self._ioctl_bytes)
+                # Get SoftWatchdog bit, the address setter may replace buffer
+                byte_buff = self._ioctl_bytes
+                ioctl(fd, 19215, byte_buff)
+                bit_7 = byte_buff[3]
             except Exception:
                 pass
             else:
                 if bit_7 != mrk:
                     # Toggling detected, wait the rest of time to free cpu
-                    self._exit.wait(self._timeout - (time() - tmr))
+                    self._exit.wait(deadline - monotonic())
                     mrk = bit_7
-                    tmr = time()
+                    deadline = monotonic() + self._timeout
                     continue
 
-            if time() - tmr >= self._timeout:
+            if monotonic() >= deadline:
                 pi.logger.debug("software watchdog timeout reached")
                 self.triggered = True
                 if self._process is not None:
@@ -88,7 +105,7 @@ class SoftwareWatchdog:
         self.triggered = False
 
         # The timeout property will start / stop the thread
-        self.timeout = int(self.timeout)
+        self.timeout = self.timeout
 
         pi.logger.debug("leave SoftwareWatchdog.reset()")
 
@@ -104,7 +121,7 @@ class SoftwareWatchdog:
     @property
     def address(self):
         """Byte address of RevPiLED byte."""
-        return unpack("<Hxx", self._ioctl_bytes)[0]
+        return self._address
 
     @address.setter
     def address(self, value):
@@ -115,7 +132,9 @@ class SoftwareWatchdog:
             raise ValueError("address must be 0 - 4095")
 
         # Use Bit 7 of RevPiLED byte (wd of Connect device)
-        self._ioctl_bytes = pack("<HBx", value, 7)
+        self._address = value
+        # New buffer, the ioctl writes the bit value to byte 3 of it
+        self._ioctl_bytes = bytearray(pack("<HBx", value, 7))
 
         pi.logger.debug("set software watchdog address to {0}".format(value))
 
@@ -169,7 +188,7 @@ class ResetDriverWatchdog(Thread):
     def __init__(self):
         super(ResetDriverWatchdog, self).__init__()
         self.daemon = True
-        self._calls = []
+        self._calls = ()
         self._exit = False
         self._fh = None
         self.not_implemented = False
@@ -221,7 +240,8 @@ class ResetDriverWatchdog(Thread):
         if not callable(function):
             return ValueError("Function is not callable.")
         if function not in self._calls:
-            self._calls.append(function)
+            # Replace the tuple, so run() can iterate without a lock
+            self._calls += (function,)
 
     def stop(self):
         """Stop watchdog for piCtory reset_driver."""
@@ -237,9 +257,11 @@ class ResetDriverWatchdog(Thread):
     def unregister_call(self, function=None):
         """Remove a function call on watchdog trigger."""
         if function is None:
-            self._calls.clear()
+            self._calls = ()
         elif function in self._calls:
-            self._calls.remove(function)
+            self._calls = tuple(
+                func for func in self._calls if func != function
+            )
 
     @property
     def triggered(self):
@@ -247,3 +269,126 @@ class ResetDriverWatchdog(Thread):
         rc = self._triggered
         self._triggered = False
         return rc
+
+
+class FileChangeWatcher:
+    """Watch files with inotify to avoid polling their mtime."""
+
+    def __init__(self):
+        """
+        Watcher for configuration files.
+
+        The parent directories are watched, so replacing a file by rename is
+        detected, too. If inotify is not available, changed() will always
+        return True and the caller checks the files on each call.
+        """
+        self._changed = True
+        self._files = ()
+        self._libc = None
+        self._names = set()
+        self._polling = False
+        self._wds = set()
+        self.fd = None
+        """File descriptor of inotify for select or None."""
+
+        try:
+            self._libc = CDLL(None, use_errno=True)
+            fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError):
+            fd = -1
+
+        if fd < 0:
+            pi.logger.warning("inotify is not available, polling config files")
+            self._polling = True
+        else:
+            self.fd = fd
+
+    def _rewatch(self):
+        """Set watches to the directories of files and symlink targets."""
+        names = set()
+        wds = set()
+        self._polling = self.fd is None
+
+        for file in self._files:
+            for path in {os.path.abspath(file), os.path.realpath(file)}:
+                dirname, name = os.path.split(path)
+                wd = self._libc.inotify_add_watch(
+                    self.fd, os.fsencode(dirname), _IN_MASK
+                )
+                if wd < 0:
+                    pi.logger.warning(
+                        "can not watch directory '{0}', polling config files"
+                        "".format(dirname)
+                    )
+                    self._polling = True
+                    continue
+                wds.add(wd)
+                names.add((wd, os.fsencode(name)))
+
+        # Watches of files, which are not used anymore
+        for wd in self._wds - wds:
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+        self._names = names
+        self._wds = wds
+
+    def changed(self):
+        """
+        Check for changes since last call.
+
+        :return: True, if a watched file may have changed
+        """
+        if self._polling:
+            return True
+        if not self._changed:
+            return False
+
+        self._changed = False
+
+        # A symlink could point to a new target now
+        self._rewatch()
+        return True
+
+    def close(self):
+        """Close inotify file descriptor."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._polling = True
+
+    def read(self):
+        """
+        Read all pending events of inotify file descriptor.
+
+        :return: True, if a watched file was changed
+        """
+        changed = False
+        try:
+            while True:
+                buff = os.read(self.fd, 4096)
+                pos = 0
+                while pos < len(buff):
+                    wd, mask, _, length = unpack_from("iIII", buff, pos)
+                    name = buff[pos + 16:pos + 16 + length].rstrip(b"\0")
+                    pos += 16 + length
+
+                    if mask & _IN_Q_OVERFLOW or (wd, name) in self._names \
+                            or mask & _IN_IGNORED and wd in self._wds:
+                        changed = True
+        except BlockingIOError:
+            pass
+
+        if changed:
+            self._changed = True
+        return changed
+
+    def watch(self, *files):
+        """
+        Set the files to watch, empty values are ignored.
+
+        :param files: Files to watch
+        """
+        self._files = tuple(file for file in files if file)
+        self._changed = True
+        if self.fd is not None:
+            self._rewatch()
@@ -4,22 +4,42 @@ __author__ = "Sven Sager"
 __copyright__ = "Copyright (C) 2023 Sven Sager"
 __license__ = "GPLv2"
 
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from threading import BoundedSemaphore, RLock, local
+from xmlrpc.client import Fault, dumps, loads
 from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
 
 from . import proginit
 from .shared.ipaclmanager import IpAclManager
 
+# Threads fuer Anfragen und Anzahl Anfragen, die darauf warten duerfen
+XMLRPC_WORKERS = 8
+XMLRPC_QUEUED = 32
 
-class SaveXMLRPCServer(SimpleXMLRPCServer):
-    """Erstellt einen erweiterten XMLRPCServer."""
+
+class SaveXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """Erstellt einen erweiterten XMLRPCServer.
+
+    Anfragen laufen in einem Threadpool mit XMLRPC_WORKERS Threads, bei mehr
+    als XMLRPC_QUEUED wartenden Anfragen werden neue Verbindungen abgelehnt.
+    Funktionen, die nicht mit concurrent=True angemeldet wurden, laufen
+    exklusiv unter lock.
+
+    """
+
+    # Verbindungen, die der Kernel hält, bis der mainloop sie annimmt
+    request_queue_size = 128
 
     def __init__(
-            self, addr, logRequests=True, allow_none=False, ipacl=None):
+            self, addr, logRequests=True, allow_none=False, ipacl=None,
+            lock=None):
         """Init SaveXMLRPCServer class.
-        @param ipacl AclManager <class 'IpAclManager'>"""
+        @param ipacl AclManager <class 'IpAclManager'>
+        @param lock Lock fuer exklusive Funktionen, sonst eigenes RLock"""
         proginit.logger.debug("enter SaveXMLRPCServer.__init__()")
 
-        if ipacl is not None and type(ipacl) != IpAclManager:
+        if ipacl is not None and not isinstance(ipacl, IpAclManager):
             raise ValueError("parameter ipacl must be <class 'IpAclManager'>")
 
         # Vererbte Klasse instantiieren
@@ -38,8 +58,13 @@ class SaveXMLRPCServer(SimpleXMLRPCServer):
             self.aclmgr = IpAclManager(0, 0)
         else:
             self.aclmgr = ipacl
-        self.funcacls = {}
-        self.requestacl = -1
+        self.functable = {}
+        self.cachedresponses = {}
+        self.lock = RLock() if lock is None else lock
+        self.__local = local()
+        self.__pool = None
+        self.__futures = {}
+        self.__sem_requests = BoundedSemaphore(XMLRPC_WORKERS + XMLRPC_QUEUED)
 
         proginit.logger.debug("leave SaveXMLRPCServer.__init__()")
 
@@ -51,31 +76,188 @@ class SaveXMLRPCServer(SimpleXMLRPCServer):
         @return Dispatched data
 
         """
-        # ACL Level für angeforderte Methode prüfen
-        if self.requestacl < self.funcacls.get(method, -1):
+        entry = self.functable.get(method)
+        if entry is None:
+            if method == "system.multicall":
+                # Einzelne Aufrufe prüfen ACL und lock selbst über _dispatch
+                return super()._dispatch(method, params)
+
+            # Funktionen ohne ACL Level, wie system.* vom Dispatcher
+            with self.lock:
+                return super()._dispatch(method, params)
+        acl_level, function, concurrent = entry
+
+        # ACL Level für angeforderte Methode prüfen (Property nur einmal lesen)
+        requestacl = self.requestacl
+        if requestacl < acl_level:
             raise RuntimeError("function call not allowed")
 
         # ACL Mode abfragen (Gibt ACL Level als Parameter)
         if method == "xmlmodus":
-            params = (self.requestacl,)
+            params = (requestacl,)
+
+        if concurrent:
+            return function(*params)
+        with self.lock:
+            # Server wurde beendet, während die Anfrage auf lock gewartet hat
+            if self.__pool is None:
+                raise RuntimeError("xmlrpc server is closed")
+            return function(*params)
+
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        """Liefert vorbereitete Antworten ohne erneutes Marshalling.
+
+        @param data XML Daten der Anfrage
+        @param dispatch_method Alternative Dispatch Funktion
+        @param path Pfad der Anfrage
+        @return Antwort als <class 'bytes'>
+
+        """
+        try:
+            params, method = loads(
+                data, use_builtin_types=self.use_builtin_types
+            )
+
+            # Vorbereitete Antwort nur ohne Parameter und mit ACL Level
+            response = self.cachedresponses.get(method)
+            if response is not None and not params \
+                    and self.requestacl >= self.functable[method][0]:
+                return response
+
+            if dispatch_method is not None:
+                response = dispatch_method(method, params)
+            else:
+                response = self._dispatch(method, params)
+            response = dumps(
+                (response,), methodresponse=True,
+                allow_none=self.allow_none, encoding=self.encoding,
+            )
+        except Fault as fault:
+            response = dumps(
+                fault, allow_none=self.allow_none, encoding=self.encoding
+            )
+        except BaseException as exc:
+            response = dumps(
+                Fault(1, "{0}:{1}".format(type(exc), exc)),
+                allow_none=self.allow_none, encoding=self.encoding,
+            )
+
+        return response.encode(self.encoding, "xmlcharrefreplace")
 
-        return super()._dispatch(method, params)
+    def __get_requestacl(self):
+        """Getter fuer ACL Level der Anfrage dieses Threads.
+        @return ACL Level oder -1"""
+        return getattr(self.__local, "requestacl", -1)
 
-    def register_function(self, acl_level, function, name=None):
+    def __set_requestacl(self, value):
+        """Setter fuer ACL Level der Anfrage dieses Threads.
+        @param value ACL Level"""
+        self.__local.requestacl = value
+
+    def __discard_future(self, future):
+        """Entfernt eine erledigte Anfrage aus den wartenden Anfragen.
+        @param future Future der Anfrage"""
+        self.__futures.pop(future, None)
+
+    def process_request(self, request, client_address):
+        """Uebergibt die Anfrage an den Threadpool oder lehnt sie ab.
+        @param request Socket der Anfrage
+        @param client_address Adresse des Clients"""
+        if self.__pool is None \
+                or not self.__sem_requests.acquire(blocking=False):
+            proginit.logger.warning(
+                "too many xmlrpc requests, reject '{0}'"
+                "".format(client_address[0])
+            )
+            self.shutdown_request(request)
+            return
+
+        future = self.__pool.submit(
+            self.process_request_thread, request, client_address
+        )
+        self.__futures[future] = request
+        future.add_done_callback(self.__discard_future)
+
+    def process_request_thread(self, request, client_address):
+        """Bearbeitet die Anfrage im Threadpool und gibt den Platz frei.
+        @param request Socket der Anfrage
+        @param client_address Adresse des Clients"""
+        try:
+            if self.__pool is None:
+                # Server wurde beendet, Anfrage nicht mehr bearbeiten
+                self.shutdown_request(request)
+            else:
+                super().process_request_thread(request, client_address)
+        finally:
+            self.__sem_requests.release()
+
+    def register_function(
+            self, acl_level, function, name=None, concurrent=False):
         """Override register_function to add acl_level.
 
         @param acl_level ACL level to call this function
         @param function Function to register
         @param name Alternative name to use
+        @param concurrent Call function without holding lock
 
         """
-        if type(acl_level) != int:
+        if not isinstance(acl_level, int):
             raise ValueError("parameter acl_level must be <class 'int'>")
 
         if name is None:
             name = function.__name__
         self.funcs[name] = function
-        self.funcacls[name] = acl_level
+        self.functable[name] = (acl_level, function, concurrent)
+
+    def unregister_function(self, name):
+        """Entfernt eine registrierte Funktion.
+        @param name Name der Funktion"""
+        self.funcs.pop(name, None)
+        self.functable.pop(name, None)
+        self.cachedresponses.pop(name, None)
+
+    def server_activate(self):
+        """Startet den Threadpool mit dem Socket."""
+        super().server_activate()
+        if self.__pool is None:
+            self.__pool = ThreadPoolExecutor(
+                max_workers=XMLRPC_WORKERS, thread_name_prefix="xmlrpc"
+            )
+
+    def server_close(self):
+        """Beendet den Threadpool, wartende Anfragen werden verworfen."""
+        super().server_close()
+        if self.__pool is not None:
+            pool = self.__pool
+            self.__pool = None
+
+            # cancel_futures von shutdown() gibt es erst ab Python 3.9
+            for future, request in self.__futures.copy().items():
+                if future.cancel():
+                    # Abgebrochene Anfrage gibt ihren Platz nicht selbst frei
+                    self.shutdown_request(request)
+                    self.__sem_requests.release()
+            pool.shutdown(wait=False)
+
+    def set_cached_response(self, name, value):
+        """Bereitet die Antwort einer Funktion ohne Parameter vor.
+
+        @param name Name der registrierten Funktion
+        @param value Rueckgabewert der Funktion oder None zum Entfernen
+
+        """
+        if value is None:
+            self.cachedresponses.pop(name, None)
+            return
+        if name not in self.functable:
+            raise ValueError("function '{0}' is not registered".format(name))
+
+        self.cachedresponses[name] = dumps(
+            (value,), methodresponse=True,
+            allow_none=self.allow_none, encoding=self.encoding,
+        ).encode(self.encoding, "xmlcharrefreplace")
+
+    requestacl = property(__get_requestacl, __set_requestacl)
 
 
 class SaveXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):